@@ -4,16 +4,46 @@ By Alejandro Ruiz Rivera, PhD.
 """
 
 import datetime
+import functools
+import gzip
+import hashlib
+import json
+import logging
 import os
+import re
+import sqlite3
+import tempfile
 import textwrap
-from io import BytesIO
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from urllib.parse import urlencode
 
 import altair as alt
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import requests
 import streamlit as st
+from matplotlib.figure import Figure
+from PIL import Image, features
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+    import pyarrow.ipc
+except ImportError:  # no columnar cache; everything is parsed from CSV
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
 # Page config
@@ -27,13 +57,46 @@ st.set_page_config(
 
 alt.theme.enable("dark")
 
-ARCHIVE_URL = (
-    "https://exoplanetarchive.ipac.caltech.edu/TAP/sync"
-    "?query=select+*+from+ps&format=csv"
+TAP_URL = "https://exoplanetarchive.ipac.caltech.edu/TAP/sync"
+
+# Columns the tabs read from the `ps` table. Projected ingest downloads only
+# these, for the default parameter set of each planet; anything else is
+# fetched per planet on demand (see fetch_planet_parameters).
+PROJECTED_INGEST = True
+ARCHIVE_COLUMNS = (
+    "pl_name", "pl_letter", "hostname", "default_flag", "pl_refname",
+    "discoverymethod", "disc_year", "disc_facility",
+    "pl_rade", "pl_bmasse", "pl_bmassj", "pl_orbsmax", "pl_orbper",
+    "pl_orbeccen", "pl_eqt", "pl_insol",
+    "st_spectype", "st_teff", "st_rad", "st_mass", "st_lum",
+    "sy_dist", "sy_snum", "sy_pnum", "rowupdate",
+    "hd_name", "hip_name", "tic_id", "gaia_id",
+    "pl_radeerr1", "pl_radeerr2", "pl_bmasseerr1", "pl_bmasseerr2",
+)
+
+
+def tap_query_url(query: str) -> str:
+    return f"{TAP_URL}?{urlencode({'query': query, 'format': 'csv'})}"
+
+
+def archive_query(columns=ARCHIVE_COLUMNS, where: str = "default_flag = 1") -> str:
+    """ADQL for the `ps` table, projected to `columns` (all when empty)."""
+    query = f"select {','.join(columns) if columns else '*'} from ps"
+    return f"{query} where {where}" if where else query
+
+
+ARCHIVE_URL = tap_query_url(
+    archive_query() if PROJECTED_INGEST else archive_query(columns=(), where="")
 )
 LOCAL_FILE = "full_table_nasa_url.csv"
 FALLBACK_FILE = "confirmed_exoplanets_data.csv"
 
+# Daily refreshes only pull rows whose `rowupdate` is newer than the local
+# snapshot; a full download still happens every ARCHIVE_FULL_REFRESH_DAYS
+# to pick up retracted planets, which a delta can't see.
+INCREMENTAL_REFRESH = True
+ARCHIVE_FULL_REFRESH_DAYS = 7
+
 CATEGORY_ORDER = ["gas_giants", "ice_giants", "super_earths", "terrestrial"]
 CATEGORY_LABELS = {
     "gas_giants": "Gas giants",
@@ -96,6 +159,12 @@ CARD_CSS = """
     line-height: 1.15;
 }
 .cat-value.txt { font-size: 1.3rem; padding-top: 0.35rem; }
+.cat-note {
+    font-family: 'Space Grotesk', sans-serif;
+    font-size: 0.74rem;
+    opacity: 0.7;
+    margin-top: 2px;
+}
 .pl-title {
     font-family: 'Space Grotesk', sans-serif;
     font-size: 2rem;
@@ -125,138 +194,1915 @@ CARD_CSS = """
     padding: 2px 10px;
     margin-left: 6px;
 }
+.artwork {
+    width: 100%;
+    height: auto;
+    border-radius: 8px;
+}
 </style>
 """
 
 
-def category_card(icon: str, label: str, value: str, accent: str, small: bool = False) -> str:
-    value_cls = "cat-value txt" if small else "cat-value"
-    return (
-        f'<div class="cat-card" style="--accent:{accent}">'
-        f'<div class="cat-icon">{icon}</div>'
-        f'<div class="cat-label">{label}</div>'
-        f'<div class="{value_cls}">{value}</div>'
-        f"</div>"
+def category_card(icon: str, label: str, value: str, accent: str, small: bool = False, note: str = "") -> str:
+    value_cls = "cat-value txt" if small else "cat-value"
+    return (
+        f'<div class="cat-card" style="--accent:{accent}">'
+        f'<div class="cat-icon">{icon}</div>'
+        f'<div class="cat-label">{label}</div>'
+        f'<div class="{value_cls}">{value}</div>'
+        + (f'<div class="cat-note">{note}</div>' if note else "")
+        + "</div>"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Data loading (no UI calls inside cached functions)
+# ---------------------------------------------------------------------------
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+ARCHIVE_MIN_ROWS = 1000
+HWC_MIN_ROWS = 100
+
+
+def _meta_path(path: str) -> str:
+    return f"{path}.meta.json"
+
+
+def read_download_meta(path: str) -> dict:
+    """Validators (ETag / Last-Modified) saved alongside a downloaded file."""
+    try:
+        with open(_meta_path(path), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_download_meta(path: str, meta: dict) -> None:
+    try:
+        with open(_meta_path(path), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+    except OSError:
+        pass
+
+
+def stream_download(url: str, dest: str, *, timeout: int, header_token: bytes, min_rows: int) -> bool:
+    """Stream `url` into `dest` through a temp file and rename it atomically.
+
+    Sends the validators from the previous download, so an unchanged file
+    costs a 304 (dest is just touched). The payload is only moved into place
+    if its header contains `header_token` and it has at least `min_rows`
+    data rows, so an error page or truncated body never clobbers good data.
+    Returns True when `dest` holds a current copy.
+    """
+    headers = {"Accept-Encoding": "gzip"}
+    meta = read_download_meta(dest) if os.path.exists(dest) else {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    tmp_path = None
+    try:
+        with requests.get(url, timeout=timeout, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                os.utime(dest)
+                return True
+            if response.status_code != 200:
+                return False
+
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(dest)), prefix=".", suffix=".part"
+            )
+            header, newlines = b"", 0
+            with os.fdopen(fd, "wb") as fh:
+                # iter_content transparently decodes the gzip transfer encoding
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    if len(header) < 2000:
+                        header += chunk[: 2000 - len(header)]
+                    newlines += chunk.count(b"\n")
+                    fh.write(chunk)
+
+            if header_token not in header.split(b"\n", 1)[0].upper() or newlines - 1 < min_rows:
+                return False
+            os.replace(tmp_path, dest)
+            tmp_path = None
+            write_download_meta(
+                dest,
+                {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                },
+            )
+            return True
+    except (requests.RequestException, OSError):
+        pass
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return False
+
+
+def download_archive() -> bool:
+    """Download today's archive snapshot. Returns True on success."""
+    if not stream_download(
+        ARCHIVE_URL, LOCAL_FILE, timeout=300, header_token=b"PL_NAME", min_rows=ARCHIVE_MIN_ROWS
+    ):
+        return False
+    meta = read_download_meta(LOCAL_FILE)
+    meta["full_refresh"] = datetime.date.today().isoformat()
+    write_download_meta(LOCAL_FILE, meta)
+    return True
+
+
+def download_archive_delta() -> bool:
+    """Merge rows updated since the local snapshot into it. Returns True on success.
+
+    Asks the archive for every parameter set whose `rowupdate` is on or after
+    the newest one in LOCAL_FILE, keyed by `pl_name` + `pl_refname`: updated
+    sets replace their old copy, a new default set replaces the planet's
+    previous default, and sets that are no longer the default are dropped.
+    Only the touched rows are categorised. Returns False when the snapshot
+    can't be refreshed this way (not projected, missing columns) or the
+    request fails, so the caller can fall back to a full download.
+    """
+    if not PROJECTED_INGEST:
+        return False
+    try:
+        local = pd.read_csv(LOCAL_FILE, low_memory=False)
+    except (OSError, ValueError):
+        return False
+    if not set(ARCHIVE_COLUMNS) <= set(local.columns):
+        return False
+    since = pd.to_datetime(local["rowupdate"], errors="coerce").max()
+    if pd.isna(since):
+        return False
+
+    url = tap_query_url(
+        archive_query(where=f"rowupdate >= to_date('{since:%Y-%m-%d}','yyyy-mm-dd')")
+    )
+    try:
+        resp = requests.get(url, timeout=120, headers={"Accept-Encoding": "gzip"})
+        if resp.status_code != 200:
+            return False
+        delta = pd.read_csv(StringIO(resp.text), low_memory=False)
+    except (requests.RequestException, ValueError):
+        return False
+    if not set(ARCHIVE_COLUMNS) <= set(delta.columns):
+        return False
+
+    if not delta.empty:
+        local_keys = pd.MultiIndex.from_frame(local[["pl_name", "pl_refname"]])
+        delta_keys = pd.MultiIndex.from_frame(delta[["pl_name", "pl_refname"]])
+        delta = delta[delta["default_flag"] > 0].copy()
+        stale = local_keys.isin(delta_keys) | local["pl_name"].isin(delta["pl_name"])
+        delta["category"] = classify_planets(delta["pl_rade"], delta["pl_bmasse"])
+        if "category" not in local.columns:  # first delta after a full download
+            local["category"] = classify_planets(local["pl_rade"], local["pl_bmasse"])
+        merged = pd.concat([local[~stale], delta], ignore_index=True)[
+            list(local.columns.union(["category"], sort=False))
+        ]
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(LOCAL_FILE)), prefix=".", suffix=".part"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as fh:
+                merged.to_csv(fh, index=False)
+            os.replace(tmp_path, LOCAL_FILE)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+    os.utime(LOCAL_FILE)
+
+    # The file no longer matches the last full download's validators
+    meta = read_download_meta(LOCAL_FILE)
+    meta.pop("etag", None)
+    meta.pop("last_modified", None)
+    write_download_meta(LOCAL_FILE, meta)
+    return True
+
+
+def refresh_archive() -> bool:
+    """Bring LOCAL_FILE up to date, incrementally when the last full download
+    is recent enough. Returns True on success."""
+    last_full = read_download_meta(LOCAL_FILE).get("full_refresh")
+    if (
+        INCREMENTAL_REFRESH
+        and os.path.exists(LOCAL_FILE)
+        and last_full
+        and (datetime.date.today() - datetime.date.fromisoformat(last_full)).days
+        < ARCHIVE_FULL_REFRESH_DAYS
+        and download_archive_delta()
+    ):
+        return True
+    return download_archive()
+
+
+# ---------------------------------------------------------------------------
+# Classification schemes
+# ---------------------------------------------------------------------------
+# Each scheme is a threshold table: per category, in CATEGORY_ORDER priority,
+# the radius (Earth radii) and/or mass (Earth masses) interval that puts a
+# planet in it. A planet takes the first category any of its intervals
+# matches; planets matching none are unclassified.
+RADIUS_THRESHOLDS = {
+    "gas_giants": pd.Interval(4.5, np.inf, closed="right"),
+    "ice_giants": pd.Interval(2.1, 4.5, closed="right"),
+    "super_earths": pd.Interval(1.0, 2.1, closed="right"),
+    "terrestrial": pd.Interval(0.1, 1.0, closed="right"),
+}
+MASS_THRESHOLDS = {
+    "gas_giants": pd.Interval(159, np.inf, closed="left"),
+    "ice_giants": pd.Interval(10, 159, closed="left"),
+    "super_earths": pd.Interval(1, 10, closed="left"),
+    "terrestrial": pd.Interval(0.1, 1, closed="neither"),
+}
+CLASSIFICATION_SCHEMES = {
+    "radius_or_mass": {
+        "label": "Radius or mass",
+        "basis": "radius (Earth radii) **or** mass (Earth masses)",
+        "thresholds": {c: {"radius": RADIUS_THRESHOLDS[c], "mass": MASS_THRESHOLDS[c]} for c in CATEGORY_ORDER},
+    },
+    "radius": {
+        "label": "Radius only",
+        "basis": "radius (Earth radii) only",
+        "thresholds": {c: {"radius": RADIUS_THRESHOLDS[c]} for c in CATEGORY_ORDER},
+    },
+    "mass": {
+        "label": "Mass only",
+        "basis": "mass (Earth masses) only",
+        "thresholds": {c: {"mass": MASS_THRESHOLDS[c]} for c in CATEGORY_ORDER},
+    },
+    "mass_radius": {
+        "label": "Radius, or mass via the mass–radius relation",
+        "basis": "radius (Earth radii); planets without one use the radius the "
+        "Chen & Kipping (2017) mass–radius relation predicts from their mass",
+        "thresholds": {c: {"radius": RADIUS_THRESHOLDS[c]} for c in CATEGORY_ORDER},
+        "radius_from_mass": True,
+    },
+}
+DEFAULT_SCHEME = "radius_or_mass"
+
+# Chen & Kipping (2017) power law R = C · M^S per mass regime (Earth units),
+# as (upper mass bound, S); C follows from continuity with R(1 M⊕) = 1.008 R⊕.
+MASS_RADIUS_RELATION = ((2.04, 0.279), (131.6, 0.589), (26_600.0, -0.044), (np.inf, 0.881))
+
+
+def radius_from_mass(mass: np.ndarray) -> np.ndarray:
+    """Radius (Earth radii) predicted from mass by MASS_RADIUS_RELATION."""
+    upper = np.array([m for m, _ in MASS_RADIUS_RELATION])
+    slope = np.array([s for _, s in MASS_RADIUS_RELATION])
+    log_c = np.empty_like(slope)
+    log_c[0] = np.log10(1.008)
+    for i in range(1, len(slope)):
+        log_c[i] = log_c[i - 1] + (slope[i - 1] - slope[i]) * np.log10(upper[i - 1])
+    regime = np.minimum(np.searchsorted(upper, mass), len(upper) - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 10 ** (log_c[regime] + slope[regime] * np.log10(mass))
+
+
+def _in_interval(values: np.ndarray, interval: pd.Interval) -> np.ndarray:
+    above = values >= interval.left if interval.closed_left else values > interval.left
+    below = values <= interval.right if interval.closed_right else values < interval.right
+    return above & below
+
+
+def category_codes(radius: np.ndarray, mass: np.ndarray, scheme: str = DEFAULT_SCHEME) -> np.ndarray:
+    """Index into CATEGORY_ORDER + ["unclassified"] for every element of the
+    radius / mass arrays (any matching shape) under a CLASSIFICATION_SCHEMES
+    entry, in one vectorised pass. NaN never matches an interval."""
+    spec = CLASSIFICATION_SCHEMES[scheme]
+    values = {"radius": radius, "mass": mass}
+    if spec.get("radius_from_mass"):
+        values["radius"] = np.where(np.isnan(radius), radius_from_mass(mass), radius)
+    conditions = [
+        np.logical_or.reduce([_in_interval(values[v], iv) for v, iv in spec["thresholds"][c].items()])
+        for c in CATEGORY_ORDER
+    ]
+    return np.select(conditions, np.arange(len(CATEGORY_ORDER), dtype=np.int8), default=len(CATEGORY_ORDER))
+
+
+def classify_planets(radius: pd.Series, mass: pd.Series, scheme: str = DEFAULT_SCHEME) -> np.ndarray:
+    """Category name of every planet under a CLASSIFICATION_SCHEMES entry."""
+    codes = category_codes(
+        pd.to_numeric(radius).to_numpy(dtype="float64", na_value=np.nan),
+        pd.to_numeric(mass).to_numpy(dtype="float64", na_value=np.nan),
+        scheme,
+    )
+    return np.array(CATEGORY_ORDER + ["unclassified"])[codes]
+
+
+def scheme_table(scheme: str) -> str:
+    """Markdown table of a scheme's thresholds."""
+    def show(iv):
+        if iv is None:
+            return "—"
+        if np.isinf(iv.right):
+            return f"{'≥' if iv.closed_left else '>'} {iv.left:g}"
+        return f"{iv.left:g} – {iv.right:g}"
+
+    spec = CLASSIFICATION_SCHEMES[scheme]
+    rows = [
+        f"| {CATEGORY_LABELS[c]} | {show(t.get('radius'))} | {show(t.get('mass'))} |"
+        for c, t in spec["thresholds"].items()
+    ]
+    return "| Category | Radius | Mass |\n|---|---|---|\n" + "\n".join(rows)
+
+
+# Compact dtypes for the processed planet table. Floats not listed in
+# FLOAT64_COLUMNS are stored as float32 (~7 significant digits, plenty for
+# radii, masses, temperatures and their errors); the `*str` / `*lim`
+# formatting columns are dropped unless KEEP_FORMATTING_COLUMNS is set.
+KEEP_FORMATTING_COLUMNS = False
+ARCHIVE_DTYPES = {
+    "category": pd.CategoricalDtype(CATEGORY_ORDER + ["unclassified"]),
+    "discoverymethod": "category",
+    "disc_facility": "category",
+    "disc_locale": "category",
+    "disc_instrument": "category",
+    "disc_telescope": "category",
+    "st_spectype": "category",
+    "st_metratio": "category",
+    "pl_bmassprov": "category",
+    "soltype": "category",
+    "disc_year": "Int16",
+    "default_flag": "Int8",
+    "sy_snum": "Int8",
+    "sy_pnum": "Int8",
+    "sy_mnum": "Int8",
+    "st_nphot": "Int16",
+    "st_nrvc": "Int16",
+    "st_nspec": "Int16",
+    "pl_nespec": "Int16",
+    "pl_ntranspec": "Int16",
+    "pl_nnotes": "Int16",
+}
+FLOAT64_COLUMNS = {
+    "ra", "dec", "glon", "glat", "elon", "elat", "x", "y", "z",
+    "pl_orbper", "pl_orbpererr1", "pl_orbpererr2",
+    "pl_tranmid", "pl_tranmiderr1", "pl_tranmiderr2",
+    "pl_orbtper", "pl_orbtpererr1", "pl_orbtpererr2",
+    # Classification inputs: category boundaries must match process_archive().
+    "pl_rade", "pl_radeerr1", "pl_radeerr2",
+    "pl_bmasse", "pl_bmasseerr1", "pl_bmasseerr2",
+}
+
+
+def compact_archive(df: pd.DataFrame, keep_formatting: bool = KEEP_FORMATTING_COLUMNS) -> pd.DataFrame:
+    """Apply ARCHIVE_DTYPES to the planet table (in place where possible).
+
+    The before/after memory footprint in bytes, both over the columns that
+    are kept, is recorded in `df.attrs["memory_footprint"]`, which survives
+    the columnar cache.
+    """
+    if not keep_formatting:
+        df = df.drop(columns=[c for c in df.columns if c.endswith(("str", "lim"))])
+    before = int(df.memory_usage(deep=True).sum())
+
+    for col in df.columns:
+        dtype = ARCHIVE_DTYPES.get(col)
+        if dtype is None and col.endswith("_flag"):
+            dtype = "Int8"
+        try:
+            if dtype is not None:
+                values = df[col]
+                if str(dtype).startswith("Int"):
+                    values = pd.to_numeric(values, errors="coerce")
+                df[col] = values.astype(dtype)
+            elif df[col].dtype == np.float64 and col not in FLOAT64_COLUMNS:
+                df[col] = df[col].astype(np.float32)
+        except (TypeError, ValueError):
+            pass  # e.g. non-integral values in an integer column: keep as is
+
+    df.attrs["memory_footprint"] = {
+        "before": before,
+        "after": int(df.memory_usage(deep=True).sum()),
+    }
+    return df
+
+
+CSV_BLOCK_SIZE = 1 << 20  # per record batch; bigger blocks mostly raise peak memory
+
+
+def _wanted_column(name: str) -> bool:
+    return KEEP_FORMATTING_COLUMNS or not name.endswith(("str", "lim"))
+
+
+def _read_archive_csv_arrow(csv_file: str) -> pd.DataFrame:
+    read_options = pyarrow.csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_SIZE)
+    header = pd.read_csv(csv_file, nrows=0).columns
+    include = [c for c in header if _wanted_column(c)]
+
+    # The streaming reader fixes column types from the first block. Columns
+    # that are empty there become float64 and dates stay strings, as with
+    # pandas; a column that changes type later on raises, and
+    # read_archive_csv() falls back to pandas.
+    first = pyarrow.csv.open_csv(
+        csv_file,
+        read_options=read_options,
+        convert_options=pyarrow.csv.ConvertOptions(include_columns=include),
+    )
+    column_types = {}
+    for field in first.schema:
+        if pyarrow.types.is_null(field.type):
+            column_types[field.name] = pyarrow.float64()
+        elif pyarrow.types.is_temporal(field.type):
+            column_types[field.name] = pyarrow.string()
+    first.close()
+
+    reader = pyarrow.csv.open_csv(
+        csv_file,
+        read_options=read_options,
+        convert_options=pyarrow.csv.ConvertOptions(
+            include_columns=include, column_types=column_types, strings_can_be_null=True
+        ),
+    )
+    batches = []
+    for batch in reader:
+        if "default_flag" in batch.schema.names:
+            batch = batch.filter(pyarrow.compute.greater(batch.column("default_flag"), 0))
+        batches.append(batch)
+    table = pyarrow.Table.from_batches(batches, schema=reader.schema)
+    del batches
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_archive_csv(csv_file: str) -> pd.DataFrame:
+    """Read the archive CSV, keeping only default parameter sets.
+
+    With pyarrow, the file is parsed by the multithreaded streaming reader,
+    formatting columns are never parsed, and non-default rows are dropped
+    batch by batch so they never become part of a DataFrame. Without
+    pyarrow (or if the Arrow parse fails) pandas reads the whole file.
+    """
+    if pyarrow is not None:
+        try:
+            return _read_archive_csv_arrow(csv_file)
+        except (pyarrow.ArrowException, OSError, ValueError):
+            pass
+
+    df = pd.read_csv(csv_file, low_memory=False, usecols=_wanted_column)
+    if "default_flag" in df.columns:
+        df = df[df["default_flag"] > 0]
+    return df
+
+
+def process_archive(csv_file: str) -> pd.DataFrame:
+    """Parse the archive CSV, keep default parameter sets, add categories."""
+    df = read_archive_csv(csv_file)
+
+    df = df.reset_index(drop=True).copy()
+    df.index += 1
+
+    # Incremental refreshes store categories with the rows they touched, so
+    # only rows without a valid one are (re)computed here.
+    if "category" not in df.columns:
+        df["category"] = classify_planets(df["pl_rade"], df["pl_bmasse"])
+    else:
+        todo = ~df["category"].isin(CATEGORY_ORDER + ["unclassified"])
+        if todo.any():
+            df.loc[todo, "category"] = classify_planets(
+                df.loc[todo, "pl_rade"], df.loc[todo, "pl_bmasse"]
+            )
+    return compact_archive(df)
+
+
+PROCESSED_CACHE_DIR = ".cache"
+PROCESSED_CACHE_VERSION = 10  # bump whenever process_archive() / process_hwc() output changes
+PROCESSED_CACHE_KEEP = 3
+
+
+def file_digest(path: str) -> str:
+    """Short content hash of a file, used to key caches derived from it."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def processed_cache_path(source: str, prefix: str) -> str:
+    return os.path.join(
+        PROCESSED_CACHE_DIR,
+        f"{prefix}-{file_digest(source)}-v{PROCESSED_CACHE_VERSION}.arrow",
+    )
+
+
+def write_columnar_cache(df: pd.DataFrame, path: str, prefix: str) -> bool:
+    """Persist a processed frame atomically as an uncompressed Arrow IPC file
+    and prune old files with the same prefix. Returns True on success.
+
+    Float columns keep NaN as a value instead of becoming Arrow nulls, so
+    map_columnar_cache() can hand them out as views without conversion.
+    Best effort: a frame pyarrow can't serialise (e.g. mixed-type columns in
+    a full `select *` download) or a read-only disk just skips the cache.
+    """
+    try:
+        table = pyarrow.Table.from_pandas(df)
+        for i, name in enumerate(table.column_names):
+            if name in df.columns and df[name].dtype.kind == "f":
+                table = table.set_column(
+                    i, name, pyarrow.array(df[name].to_numpy(), from_pandas=False)
+                )
+        os.makedirs(PROCESSED_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=PROCESSED_CACHE_DIR, prefix=".", suffix=".part")
+        os.close(fd)
+        try:
+            with pyarrow.OSFile(tmp_path, "wb") as sink:
+                with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except (OSError, ValueError, TypeError, pyarrow.ArrowException):
+        return False
+
+    cached = sorted(
+        (os.path.join(PROCESSED_CACHE_DIR, f) for f in os.listdir(PROCESSED_CACHE_DIR)
+         if f.startswith(f"{prefix}-") and f.endswith(".arrow")),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for stale in cached[PROCESSED_CACHE_KEEP:]:
+        try:
+            os.remove(stale)  # processes still mapping it keep their view
+        except OSError:
+            pass
+    return True
+
+
+def map_columnar_cache(path: str) -> pd.DataFrame:
+    """Memory-map an Arrow IPC cache file read-only and wrap it in a frame.
+
+    Numeric columns and strings (as Arrow-backed `string[pyarrow]`) are
+    views over the mapping rather than private copies, so every worker
+    process mapping the same file shares one copy in the page cache.
+    """
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(path, "r")).read_all()
+    arrow_strings = pd.StringDtype("pyarrow")
+    return table.to_pandas(
+        split_blocks=True,
+        types_mapper={pyarrow.string(): arrow_strings, pyarrow.large_string(): arrow_strings}.get,
+    )
+
+
+def load_columnar(source: str, prefix: str, process) -> pd.DataFrame:
+    """`process(source)`, served from (and saved to) the shared columnar cache."""
+    if pyarrow is None:
+        return process(source)
+
+    cache_path = processed_cache_path(source, prefix)
+    if not os.path.exists(cache_path):
+        df = process(source)
+        if not write_columnar_cache(df, cache_path, prefix):
+            return df
+    try:
+        return map_columnar_cache(cache_path)
+    except (OSError, ValueError, pyarrow.ArrowException):
+        return process(source)
+
+
+# cache_resource, not cache_data: every session shares the one mapped frame
+# instead of unpickling a private copy. Callers must treat it as read-only.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_dataframe(csv_file: str, cache_key: str) -> pd.DataFrame:
+    """Load the processed planet table for an archive snapshot.
+
+    `cache_key` (the snapshot date) makes the cache refresh when new data
+    is downloaded. The processed frame is kept on disk as Arrow IPC, keyed
+    by a hash of the CSV, so restarts and redeploys skip the CSV parse and
+    all worker processes map the same file.
+    """
+    return load_columnar(csv_file, "planets", process_archive)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_classified(_planets_df: pd.DataFrame, scheme: str, cache_key: str) -> pd.DataFrame:
+    """The planet table categorised under `scheme`, per (snapshot, scheme).
+
+    The default scheme is what process_archive() stored, so the snapshot
+    frame is returned as is; other schemes get a shallow copy with their own
+    `category` column, sharing every other column with the snapshot frame.
+    """
+    if scheme == DEFAULT_SCHEME:
+        return _planets_df
+    df = _planets_df.copy(deep=False)
+    df["category"] = pd.Categorical(
+        classify_planets(df["pl_rade"], df["pl_bmasse"], scheme),
+        dtype=ARCHIVE_DTYPES["category"],
+    )
+    return df
+
+
+def _category_chart_frame(counts: pd.Series) -> pd.DataFrame:
+    frame = (
+        counts.drop("unclassified")
+        .rename(index=CATEGORY_LABELS)
+        .rename_axis("Category")
+        .reset_index(name="Planets")
+    )
+    frame = frame[frame["Planets"] > 0].reset_index(drop=True)
+    frame["Percentage"] = frame["Planets"] / frame["Planets"].sum() * 100
+    frame["pct_label"] = frame["Percentage"].map(lambda p: f"{p:.1f}%")
+    return frame
+
+
+# Shared and read-only, like load_dataframe(): one copy per (snapshot,
+# scheme) instead of unpickling the frames on every rerun.
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_aggregates(_planets_df: pd.DataFrame, cache_key: str) -> dict:
+    """Per-snapshot aggregates behind the Detection methods and Population
+    statistics tabs, so they only do lookups.
+
+    `cube` counts planets by discoverymethod × category × disc_year ×
+    disc_facility and can back other breakdowns; the rest is derived from
+    it: the method list, category counts and donut frame per method (plus
+    "All"), and the method totals with percentages. `cache_key` identifies
+    the snapshot and classification scheme. Callers must not mutate the
+    result.
+    """
+    dims = ["discoverymethod", "category", "disc_year", "disc_facility"]
+    cube = (
+        _planets_df.groupby(
+            [d for d in dims if d in _planets_df.columns], observed=True, dropna=False
+        )
+        .size()
+        .rename("Planets")
+    )
+    all_categories = CATEGORY_ORDER + ["unclassified"]
+    by_method = cube.groupby(level=["discoverymethod", "category"], observed=True).sum()
+
+    methods = sorted(m for m in by_method.index.get_level_values(0).unique() if pd.notna(m))
+    category_counts = {
+        "All": cube.groupby(level="category", observed=True).sum().reindex(all_categories, fill_value=0)
+    }
+    for method in methods:
+        category_counts[method] = by_method.loc[method].reindex(all_categories, fill_value=0)
+
+    method_counts = (
+        by_method.groupby(level="discoverymethod", observed=True)
+        .sum()
+        .sort_values(ascending=False, kind="stable")
+        .rename_axis("Method")
+        .reset_index(name="Planets")
+    )
+    method_counts = method_counts[method_counts["Method"].notna()].reset_index(drop=True)
+    method_counts["Percentage"] = method_counts["Planets"] / method_counts["Planets"].sum() * 100
+    # Only label slices large enough to have room; small ones use tooltip/table
+    method_counts["pct_label"] = np.where(
+        method_counts["Percentage"] >= 2.0,
+        method_counts["Percentage"].map(lambda p: f"{p:.1f}%"),
+        "",
+    )
+
+    return {
+        "cube": cube,
+        "methods": ["All"] + methods,
+        "category_counts": category_counts,
+        "category_charts": {m: _category_chart_frame(c) for m, c in category_counts.items()},
+        "method_counts": method_counts,
+    }
+
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    """Numeric column as float64 with NaN for missing values (all NaN if absent)."""
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[name]).to_numpy(dtype="float64", na_value=np.nan)
+
+
+# Monte Carlo category membership: draws per planet, elements per sampled
+# array (bounds memory to a few tens of MB), RNG seed for stable results.
+MC_SAMPLES = 500
+MC_CHUNK_ELEMENTS = 1 << 21
+MC_SEED = 2014
+
+
+def _split_normal(value: np.ndarray, err_hi: np.ndarray, err_lo: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """Draws around `value` with upper / lower 1σ errors (missing errors: none)."""
+    sigma = np.where(z >= 0, np.nan_to_num(err_hi)[:, None], np.nan_to_num(np.abs(err_lo))[:, None])
+    return value[:, None] + z * sigma
+
+
+def category_probabilities(df: pd.DataFrame, scheme: str = DEFAULT_SCHEME, n_samples: int = MC_SAMPLES) -> np.ndarray:
+    """(planets × categories) membership probabilities, CATEGORY_ORDER then
+    unclassified, from `n_samples` draws of radius and mass per planet.
+
+    Errors are treated as an asymmetric (split) normal around the point value.
+    All planets are sampled at once in row chunks of MC_CHUNK_ELEMENTS draws.
+    """
+    cols = {
+        c: _column(df, c)
+        for c in ("pl_rade", "pl_radeerr1", "pl_radeerr2", "pl_bmasse", "pl_bmasseerr1", "pl_bmasseerr2")
+    }
+    rng = np.random.default_rng(MC_SEED)
+    n_codes = len(CATEGORY_ORDER) + 1
+    probs = np.empty((len(df), n_codes), dtype=np.float32)
+    step = max(1, MC_CHUNK_ELEMENTS // n_samples)
+    for start in range(0, len(df), step):
+        rows = slice(start, start + step)
+        shape = (len(cols["pl_rade"][rows]), n_samples)
+        radius = _split_normal(cols["pl_rade"][rows], cols["pl_radeerr1"][rows], cols["pl_radeerr2"][rows], rng.standard_normal(shape))
+        mass = _split_normal(cols["pl_bmasse"][rows], cols["pl_bmasseerr1"][rows], cols["pl_bmasseerr2"][rows], rng.standard_normal(shape))
+        codes = category_codes(radius, mass, scheme)
+        # Per-row histogram of codes: offset each row's codes into its own range.
+        flat = (codes + np.arange(shape[0])[:, None] * n_codes).ravel()
+        probs[rows] = np.bincount(flat, minlength=shape[0] * n_codes).reshape(shape[0], n_codes) / n_samples
+    return probs
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_category_uncertainty(_planets_df: pd.DataFrame, scheme: str, cache_key: str) -> dict:
+    """Expected category counts with 95% intervals per detection method (plus
+    "All"), from category_probabilities(), per (snapshot, scheme).
+
+    Counts are sums of membership probabilities; the interval is the normal
+    approximation to the Poisson-binomial spread, Σ p(1 − p), clipped to the
+    planets in the selection.
+    """
+    probs = category_probabilities(_planets_df, scheme).astype(np.float64)
+    methods = _planets_df["discoverymethod"].astype(object).fillna("Unknown").to_numpy()
+    sums = pd.DataFrame(probs).groupby(methods).sum()
+    variances = pd.DataFrame(probs * (1 - probs)).groupby(methods).sum()
+    sums.loc["All"] = probs.sum(axis=0)
+    variances.loc["All"] = (probs * (1 - probs)).sum(axis=0)
+    sizes = pd.Series(methods).value_counts()
+    sizes["All"] = len(methods)
+
+    expected = {}
+    for method in sums.index:
+        half_width = 1.96 * np.sqrt(variances.loc[method].to_numpy())
+        mean = sums.loc[method].to_numpy()
+        expected[method] = pd.DataFrame(
+            {"expected": mean, "low": np.clip(mean - half_width, 0, None), "high": np.minimum(mean + half_width, sizes[method])},
+            index=CATEGORY_ORDER + ["unclassified"],
+        )
+    return {"probabilities": probs.astype(np.float32), "expected": expected}
+
+
+SCATTER_BINS = (64, 40)  # log-spaced bins along semi-major axis, mass
+
+
+def _density_frame(counts: np.ndarray, categories: np.ndarray, x_edges, y_edges) -> pd.DataFrame:
+    """Non-empty bins of a 2D histogram as rows with their (linear) bounds."""
+    ix, iy = np.nonzero(counts)
+    return pd.DataFrame({
+        "pl_orbsmax": 10 ** x_edges[ix],
+        "pl_orbsmax_hi": 10 ** x_edges[ix + 1],
+        "pl_bmasse": 10 ** y_edges[iy],
+        "pl_bmasse_hi": 10 ** y_edges[iy + 1],
+        "Planets": counts[ix, iy],
+        "Category": categories[ix, iy],
+    })
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_scatter(_planets_df: pd.DataFrame, cache_key: str) -> dict:
+    """Mass vs orbit plotting data for a snapshot, per category label
+    ("All categories" included): the plottable planets (`points`) and their
+    log–log binned density on a grid shared by all labels (`density`).
+
+    For "All categories" each bin takes the colour of its most common category.
+    """
+    points = _planets_df[["pl_name", "category", "pl_orbsmax", "pl_bmasse"]]
+    points = points[
+        (points["pl_orbsmax"] > 0) & (points["pl_bmasse"] > 0) & (points["category"] != "unclassified")
+    ].reset_index(drop=True)
+    points["Category"] = points["category"].map(CATEGORY_LABELS).astype(object)
+
+    log_x = np.log10(points["pl_orbsmax"].to_numpy(dtype="float64"))
+    log_y = np.log10(points["pl_bmasse"].to_numpy(dtype="float64"))
+    x_edges = np.linspace(log_x.min(), log_x.max(), SCATTER_BINS[0] + 1) if len(points) else np.arange(2.0)
+    y_edges = np.linspace(log_y.min(), log_y.max(), SCATTER_BINS[1] + 1) if len(points) else np.arange(2.0)
+
+    labels = [CATEGORY_LABELS[c] for c in CATEGORY_ORDER]
+    codes = pd.Categorical(points["Category"], categories=labels).codes
+    counts = np.stack([
+        np.histogram2d(log_x[codes == i], log_y[codes == i], bins=(x_edges, y_edges))[0].astype(np.int64)
+        for i in range(len(labels))
+    ])
+
+    by_label = {"All categories": {
+        "points": points,
+        "density": _density_frame(counts.sum(axis=0), np.array(labels)[counts.argmax(axis=0)], x_edges, y_edges),
+    }}
+    for i, label in enumerate(labels):
+        by_label[label] = {
+            "points": points[codes == i].reset_index(drop=True),
+            "density": _density_frame(counts[i], np.full(counts[i].shape, label, dtype=object), x_edges, y_edges),
+        }
+    return by_label
+
+
+DEFAULT_PLANET = "Kepler-167 e"
+
+
+def name_positions(names) -> dict:
+    """name -> position of its first occurrence in `names`."""
+    positions = {}
+    for pos, name in enumerate(names):
+        positions.setdefault(name, pos)
+    return positions
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_lookups(_planets_df: pd.DataFrame, cache_key: str) -> dict:
+    """Per-snapshot lookup structures for the Planet explorer: the sorted
+    selector list, the default selection and a name -> row position map, so
+    picking a planet is a dict lookup plus `iloc`. Shared and read-only."""
+    names = _planets_df["pl_name"].astype(object)
+    planet_names = sorted(names.dropna().unique())
+    return {
+        "planet_names": planet_names,
+        "planet_pos": name_positions(names),
+        "default_index": planet_names.index(DEFAULT_PLANET) if DEFAULT_PLANET in planet_names else 0,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Fuzzy name search (trigram index over names and catalog aliases)
+# ---------------------------------------------------------------------------
+ALIAS_COLUMNS = ("hd_name", "hip_name", "tic_id", "gaia_id")
+SEARCH_MIN_SCORE = 0.3
+SEARCH_LIMIT = 25
+
+
+def normalise_names(values: pd.Series) -> pd.Series:
+    """Lowercase and drop everything but letters and digits, so 'HD 209458 b',
+    'hd209458b' and 'HD-209458 B' all compare equal."""
+    return values.astype(str).str.lower().str.replace(r"[^a-z0-9]+", "", regex=True)
+
+
+def build_search_index(entries: pd.DataFrame) -> dict:
+    """Trigram index over `entries` ('name' to return, 'text' to match).
+
+    Several texts may point at the same name (its aliases). Each text is
+    normalised and padded with ^/$ so prefixes and endings weigh in.
+    """
+    entries = entries.dropna()
+    keys = normalise_names(entries["text"])
+    names = pd.Index(pd.unique(entries["name"].astype(str)))
+    owners = names.get_indexer(entries["name"].astype(str))
+    keep = (keys.str.len() > 0).to_numpy()
+    keys, owners = keys[keep].tolist(), owners[keep]
+
+    postings = {}
+    n_grams = np.empty(len(keys), dtype=np.int32)
+    for key_id, key in enumerate(keys):
+        padded = f"^{key}$"
+        grams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+        n_grams[key_id] = len(grams)
+        for gram in grams:
+            postings.setdefault(gram, []).append(key_id)
+    return {
+        "names": names.tolist(),
+        "keys": keys,
+        "key_array": np.array(keys, dtype=str),
+        "owners": owners,
+        "n_grams": n_grams,
+        "postings": {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()},
+    }
+
+
+def search_index(index: dict, query: str, limit: int = SEARCH_LIMIT) -> list:
+    """Names ranked by best alias match for `query`, typo-tolerant.
+
+    Scores are the Dice overlap of trigram sets, plus a bonus for exact and
+    prefix matches; each name keeps its best-scoring alias.
+    """
+    query = normalise_names(pd.Series([query])).iloc[0]
+    if not query:
+        return []
+    if len(query) < 3:
+        # Too short for trigrams to discriminate: plain prefix match.
+        owners = index["owners"][np.char.startswith(index["key_array"], query)]
+        return [index["names"][o] for o in pd.unique(owners)[:limit]]
+
+    padded = f"^{query}$"
+    grams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+    hits = [index["postings"][g] for g in grams if g in index["postings"]]
+    if not hits:
+        return []
+
+    shared = np.bincount(np.concatenate(hits), minlength=len(index["keys"]))
+    candidates = np.flatnonzero(shared)
+    scores = 2 * shared[candidates] / (len(grams) + index["n_grams"][candidates])
+    top = np.argsort(-scores, kind="stable")[: limit * 8]
+    candidates, scores = candidates[top], scores[top]
+    keys = index["keys"]
+    scores = scores + [
+        1.0 if keys[k] == query else 0.5 if keys[k].startswith(query) else 0.0
+        for k in candidates
+    ]
+
+    best = {}
+    for key_id, score in zip(candidates, scores):
+        if score >= SEARCH_MIN_SCORE:
+            owner = index["owners"][key_id]
+            best[owner] = max(best.get(owner, 0.0), score)
+    ranked = sorted(best, key=lambda owner: -best[owner])[:limit]
+    return [index["names"][owner] for owner in ranked]
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_search_index(_planets_df: pd.DataFrame, cache_key: str) -> dict:
+    """Search index over planet names plus their HD / HIP / TIC / Gaia
+    designations, both as the star alias alone and with the planet letter."""
+    name = _planets_df["pl_name"].astype(object)
+    parts = [pd.DataFrame({"name": name, "text": name})]
+    letter = _planets_df["pl_letter"].astype(object) if "pl_letter" in _planets_df else None
+    for col in ALIAS_COLUMNS:
+        if col in _planets_df.columns:
+            alias = _planets_df[col].astype(object)
+            parts.append(pd.DataFrame({"name": name, "text": alias}))
+            if letter is not None:
+                parts.append(pd.DataFrame({"name": name, "text": alias + " " + letter}))
+    return build_search_index(pd.concat(parts, ignore_index=True))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_hwc_search_index(_hab_df: pd.DataFrame, cache_key: str) -> dict:
+    """Search index over the habitable subset: planet and host-star names."""
+    name = _hab_df["p_name"].astype(object)
+    parts = [pd.DataFrame({"name": name, "text": name})]
+    if "s_name" in _hab_df.columns:
+        parts.append(pd.DataFrame({"name": name, "text": _hab_df["s_name"].astype(object)}))
+    return build_search_index(pd.concat(parts, ignore_index=True))
+
+
+def archive_on_disk():
+    """(path, snapshot date) of the best archive file on disk, or None."""
+    for path in (LOCAL_FILE, FALLBACK_FILE):
+        if os.path.exists(path):
+            return path, datetime.date.fromtimestamp(os.path.getmtime(path))
+    return None
+
+
+def ensure_data() -> tuple[str, datetime.date]:
+    """Return the live archive snapshot, refreshed in the background.
+
+    Only blocks when there is nothing on disk to serve yet (first run).
+    """
+    refresher = start_refresher()
+    live = refresher["archive"]
+    if live is None:
+        with st.spinner("Downloading the NASA Exoplanet Archive (first run can take a minute)…"):
+            refresher["wake"].set()
+            refresher["ready"].wait(timeout=600)
+        live = refresher["archive"]
+        if live is None:
+            st.error(
+                "Could not reach the NASA Exoplanet Archive and no local snapshot "
+                "is available. Please try again shortly."
+            )
+            st.stop()
+    elif live[1] != datetime.date.today():
+        refresher["wake"].set()
+
+    if live[0] == FALLBACK_FILE:
+        st.warning(
+            "Could not reach the NASA Exoplanet Archive. "
+            f"Showing the bundled snapshot from {live[1]}."
+        )
+    return live
+
+
+@st.cache_data(show_spinner=False, ttl=24 * 3600, max_entries=200)
+def fetch_planet_parameters(planet_name: str):
+    """Fetch every `ps` column of a planet's default parameter set from the
+    archive, for parameters the projected snapshot doesn't carry.
+
+    Returns a Series, or None if the archive has no such planet. Network
+    and parse errors (requests.RequestException, ValueError) propagate, so
+    a failed lookup is never cached.
+    """
+    escaped = planet_name.replace("'", "''")
+    url = tap_query_url(archive_query(columns=(), where=f"default_flag = 1 and pl_name = '{escaped}'"))
+    resp = requests.get(url, timeout=30, headers={"Accept-Encoding": "gzip"})
+    resp.raise_for_status()
+    rows = pd.read_csv(StringIO(resp.text), low_memory=False)
+    return None if rows.empty else rows.iloc[0]
+
+
+HWC_URL = "https://www.hpcf.upr.edu/~abel/phl/hwc/data/hwc.csv"
+HWC_FILES = ("hwc.csv", "hwc_full.csv", "hwc_simplified.csv")
+HWC_MAX_AGE_DAYS = 7
+
+
+def download_hwc() -> bool:
+    """Download a fresh HWC snapshot from PHL. Returns True on success.
+
+    Validates the payload looks like the catalog (header contains P_NAME)
+    before overwriting, so a server error page never clobbers good data.
+    """
+    return stream_download(
+        HWC_URL, "hwc.csv", timeout=120, header_token=b"P_NAME", min_rows=HWC_MIN_ROWS
+    )
+
+
+def hwc_is_current() -> bool:
+    """True if hwc.csv exists and is at most HWC_MAX_AGE_DAYS old."""
+    if not os.path.exists("hwc.csv"):
+        return False
+    age_days = (datetime.date.today() - datetime.date.fromtimestamp(os.path.getmtime("hwc.csv"))).days
+    return age_days <= HWC_MAX_AGE_DAYS
+
+
+def hwc_on_disk() -> str:
+    """Cache key derived from the HWC file that would be used, or '' if
+    no HWC data is available at all."""
+    for path in HWC_FILES:
+        if os.path.exists(path):
+            return f"{path}:{os.path.getmtime(path)}"
+    return ""
+
+
+def ensure_hwc() -> str:
+    """Return the cache key of the live HWC snapshot ('' if there is none yet).
+
+    Never blocks: a missing or stale hwc.csv is fetched by the background
+    refresher, and the previous copy stays live until the new one is loaded.
+    """
+    refresher = start_refresher()
+    if not hwc_is_current():
+        refresher["wake"].set()
+    return refresher["hwc"]
+
+
+# Canonical name -> the names that column has had across HWC releases.
+HWC_COLUMNS = {
+    "p_name": ("p_name", "name", "pl_name"),
+    "p_habitable": ("p_habitable",),
+    "p_esi": ("p_esi", "esi"),
+    "p_type": ("p_type",),
+    "p_mass": ("p_mass",),
+    "p_radius": ("p_radius",),
+    "p_period": ("p_period",),
+    "p_semi_major_axis": ("p_semi_major_axis", "p_sma"),
+    "p_temp_surf": ("p_temp_surf",),
+    "p_temp_equil": ("p_temp_equil",),
+    "s_name": ("s_name", "hostname"),
+    "s_type": ("s_type", "s_spec_type"),
+    "s_distance": ("s_distance", "p_distance", "sy_dist"),
+    "p_detection": ("p_detection", "p_detection_method"),
+    "p_year": ("p_year", "p_discovery_year"),
+}
+HWC_NUMERIC = (
+    "p_habitable", "p_esi", "p_mass", "p_radius", "p_period", "p_semi_major_axis",
+    "p_temp_surf", "p_temp_equil", "s_distance", "p_year",
+)
+
+
+def process_hwc(csv_file: str) -> pd.DataFrame:
+    """Read an HWC CSV and normalise it: the columns the app uses are renamed
+    to their canonical (lowercase) name, whichever variant this release
+    uses, and numeric fields are coerced to float64 once. The original
+    names and types are kept in `df.attrs["source_columns"]` and
+    `df.attrs["source_dtypes"]`."""
+    df = pd.read_csv(csv_file, low_memory=False)
+    lookup = {c.lower(): c for c in df.columns}
+    renames = {}
+    for canonical, candidates in HWC_COLUMNS.items():
+        found = next((lookup[c] for c in candidates if c in lookup), None)
+        if found is not None:
+            renames[found] = canonical
+    df = df.rename(columns=renames)
+    source_dtypes = {}
+    for col in HWC_NUMERIC:
+        if col in df.columns:
+            source_dtypes[col] = str(df[col].dtype)
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    # Canonical -> this release's name and type, for hwc_export().
+    df.attrs["source_columns"] = {canonical: found for found, canonical in renames.items()}
+    df.attrs["source_dtypes"] = source_dtypes
+    return df
+
+
+def habitable_view(df: pd.DataFrame) -> dict:
+    """Selector structures for a frame with canonical HWC columns: the
+    potentially habitable subset sorted by ESI (`habitable`, with a `_sample`
+    column) and the `frame` position of each of its rows (`frame_pos`), its
+    sample sizes, and the selector list (`names`) with its name -> row
+    position map (`pos`)."""
+    frame_pos = np.arange(len(df))
+    if "p_habitable" in df.columns:
+        frame_pos = np.flatnonzero(df["p_habitable"].fillna(0).to_numpy() > 0)
+    if "p_esi" in df.columns:  # best first, missing ESI last
+        frame_pos = frame_pos[np.argsort(-df["p_esi"].to_numpy()[frame_pos], kind="stable")]
+    hab_df = df.iloc[frame_pos].reset_index(drop=True)
+    if "p_habitable" in df.columns:
+        hab_df["_sample"] = np.where(hab_df["p_habitable"] == 1, "Conservative", "Optimistic")
+    else:
+        hab_df["_sample"] = "—"
+
+    names = hab_df["p_name"].astype(str)
+    return {
+        "frame": df,
+        "habitable": hab_df,
+        "frame_pos": frame_pos,
+        "n_conservative": int((hab_df["_sample"] == "Conservative").sum()),
+        "n_optimistic": int((hab_df["_sample"] == "Optimistic").sum()),
+        "names": hab_df["p_name"].dropna().astype(str).tolist(),
+        "pos": name_positions(names),
+    }
+
+
+# Shared and read-only, like load_dataframe().
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_hwc(cache_key: str):
+    """Load an HWC snapshot, normalised by process_hwc().
+
+    Returns None if there is no HWC data, else the full `frame` plus its
+    habitable_view() (`habitable` is None if the file has no planet names).
+    `cache_key` comes from hwc_on_disk() and names the file to read.
+    """
+    path = cache_key.rpartition(":")[0]
+    if not path or not os.path.exists(path):
+        return None
+    df = load_columnar(path, "hwc", process_hwc)
+    if "p_name" not in df.columns:
+        return {"frame": df, "habitable": None}
+    return habitable_view(df)
+
+
+def hwc_num(row: pd.Series, col: str, decimals: int = 2) -> str:
+    """Numeric HWC field -> display string ('—' when absent or missing)."""
+    return fmt(row[col], decimals) if col in row.index else "—"
+
+
+def hwc_export(df: pd.DataFrame, attrs: dict) -> pd.DataFrame:
+    """A habitable_view() table in the catalog's own format, given the
+    `attrs` of the frame process_hwc() built: original column names, and
+    integer columns back from float64. Frames without those attrs (the
+    archive-computed catalog) keep their names."""
+    out = df.drop(columns="_sample")
+    for col, dtype in attrs.get("source_dtypes", {}).items():
+        if col in out.columns and dtype.startswith("int"):
+            out[col] = out[col].astype(dtype)
+    return out.rename(columns=attrs.get("source_columns", {}))
+
+
+def hwc_text(row: pd.Series, col: str) -> str:
+    """Text HWC field -> display string ('—' when absent or missing)."""
+    return str(row[col]) if col in row.index and pd.notna(row[col]) else "—"
+
+
+# ---------------------------------------------------------------------------
+# Archive <-> HWC cross-match
+# ---------------------------------------------------------------------------
+def _crossmatch_keys(names: pd.Series, hosts: pd.Series, letters: pd.Series) -> pd.DataFrame:
+    """Normalised planet-name and host-star + letter join keys (NA if unusable)."""
+    return pd.DataFrame({
+        "name": normalise_names(names).where(names.notna()),
+        "host": (normalise_names(hosts) + letters.astype(str).str.lower()).where(
+            hosts.notna() & letters.notna()
+        ),
+        "pos": np.arange(len(names)),
+    })
+
+
+def _unique_pairs(left: pd.DataFrame, right: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Inner join on `key`, ignoring keys that are ambiguous on either side."""
+    left = left.dropna(subset=[key]).drop_duplicates(key, keep=False)
+    right = right.dropna(subset=[key]).drop_duplicates(key, keep=False)
+    return left[[key, "pos"]].merge(right[[key, "pos"]], on=key, suffixes=("_arch", "_hwc"))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_crossmatch(_planets_df: pd.DataFrame, _hwc: dict, cache_key: str) -> dict:
+    """Link archive planets to HWC rows for one (archive, HWC) snapshot pair.
+
+    Planets are matched on their normalised name first; the rest fall back to
+    host star + planet letter, for planets the catalogs name differently but
+    place around the same star. Ambiguous keys are never matched.
+    Returns row-position arrays both ways (-1 where unmatched), the match
+    method per HWC row, and coverage counts.
+    """
+    frame = _hwc["frame"]
+    arch = _crossmatch_keys(
+        _planets_df["pl_name"].astype(object),
+        _planets_df["hostname"].astype(object),
+        _planets_df["pl_letter"].astype(object),
+    )
+    hwc_names = frame["p_name"].astype(object)
+    hwc = _crossmatch_keys(
+        hwc_names,
+        frame["s_name"].astype(object) if "s_name" in frame.columns else pd.Series(pd.NA, index=frame.index),
+        hwc_names.str.extract(r"\s([A-Za-z])$", expand=False),
+    )
+
+    hwc_pos = np.full(len(arch), -1, dtype=np.int64)
+    arch_pos = np.full(len(hwc), -1, dtype=np.int64)
+    method = np.full(len(hwc), "", dtype=object)
+    for key in ("name", "host"):
+        pairs = _unique_pairs(arch[hwc_pos[arch["pos"]] < 0], hwc[arch_pos[hwc["pos"]] < 0], key)
+        hwc_pos[pairs["pos_arch"].to_numpy()] = pairs["pos_hwc"].to_numpy()
+        arch_pos[pairs["pos_hwc"].to_numpy()] = pairs["pos_arch"].to_numpy()
+        method[pairs["pos_hwc"].to_numpy()] = key
+
+    hab_arch_pos = arch_pos[_hwc["frame_pos"]]
+    hab_method = method[_hwc["frame_pos"]]
+    return {
+        "hwc_pos": hwc_pos,
+        "arch_pos": arch_pos,
+        "hab_arch_pos": hab_arch_pos,
+        "coverage": {
+            "hwc": len(frame),
+            "matched": int((arch_pos >= 0).sum()),
+            "habitable": len(hab_arch_pos),
+            "habitable_matched": int((hab_arch_pos >= 0).sum()),
+            "habitable_by_name": int((hab_method == "name").sum()),
+            "habitable_by_host": int((hab_method == "host").sum()),
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Habitability computed from the archive
+# ---------------------------------------------------------------------------
+# Kopparapu et al. (2014) habitable-zone limits as effective stellar flux
+# S_eff = S0 + a·T + b·T² + c·T³ + d·T⁴, T = Teff − 5780 K, fitted for 2600–7200 K.
+HZ_LIMITS = {
+    "recent_venus": (1.776, 2.136e-4, 2.533e-8, -1.332e-11, -3.097e-15),
+    "runaway_greenhouse": (1.107, 1.332e-4, 1.580e-8, -8.308e-12, -1.931e-15),
+    "maximum_greenhouse": (0.356, 6.171e-5, 1.698e-9, -3.198e-12, -5.575e-16),
+    "early_mars": (0.320, 5.547e-5, 1.526e-9, -2.874e-12, -5.011e-16),
+}
+HZ_TEFF_RANGE = (2600, 7200)
+# Earth Similarity Index terms (Schulze-Makuch et al. 2011): Earth reference
+# value and weight. Temperature is compared as equilibrium temperature.
+ESI_TERMS = {
+    "radius": (1.0, 0.57),
+    "density": (1.0, 1.07),
+    "escape_velocity": (1.0, 0.70),
+    "temperature": (255.0, 5.58),
+}
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_habitability(_planets_df: pd.DataFrame, cache_key: str) -> dict:
+    """Habitable-zone position and ESI for every archive planet, computed in
+    one vectorised pass and shaped like load_hwc() (canonical HWC columns plus
+    habitable_view()), so tab 5 can rank the archive without the HWC.
+
+    Gaps are filled from related parameters: luminosity from stellar radius
+    and Teff, semi-major axis from period and stellar mass, insolation from
+    luminosity and orbit, equilibrium temperature from insolation, and radius
+    from mass (mass–radius relation). ESI uses the terms a planet has, and
+    needs at least radius and temperature. `p_habitable` follows the HWC
+    convention: 1 conservative, 2 optimistic, 0 neither.
+    """
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        teff = _column(_planets_df, "st_teff")
+        lum = 10 ** _column(_planets_df, "st_lum")  # archive stores log10(L/L☉)
+        lum = np.where(np.isnan(lum), _column(_planets_df, "st_rad") ** 2 * (teff / 5772) ** 4, lum)
+
+        sma = _column(_planets_df, "pl_orbsmax")
+        period_yr = _column(_planets_df, "pl_orbper") / 365.25
+        sma = np.where(np.isnan(sma), np.cbrt(_column(_planets_df, "st_mass") * period_yr ** 2), sma)
+        insol = _column(_planets_df, "pl_insol")
+        insol = np.where(np.isnan(insol), lum / sma ** 2, insol)
+
+        t = np.clip(teff, *HZ_TEFF_RANGE) - 5780  # cooler/hotter stars use the edge of the fit
+        s_eff = {
+            name: s0 + a * t + b * t ** 2 + c * t ** 3 + d * t ** 4
+            for name, (s0, a, b, c, d) in HZ_LIMITS.items()
+        }
+        conservative = (insol <= s_eff["runaway_greenhouse"]) & (insol >= s_eff["maximum_greenhouse"])
+        optimistic = (insol <= s_eff["recent_venus"]) & (insol >= s_eff["early_mars"])
+
+        mass = _column(_planets_df, "pl_bmasse")
+        measured_radius = _column(_planets_df, "pl_rade")
+        radius = np.where(np.isnan(measured_radius), radius_from_mass(mass), measured_radius)
+        teq = _column(_planets_df, "pl_eqt")
+        teq = np.where(np.isnan(teq), ESI_TERMS["temperature"][0] * insol ** 0.25, teq)
+
+        values = {
+            "radius": radius,
+            "density": mass / radius ** 3,
+            "escape_velocity": np.sqrt(mass / radius),
+            "temperature": teq,
+        }
+        log_sum = np.zeros(len(_planets_df))
+        n_terms = np.zeros(len(_planets_df))
+        for name, (ref, weight) in ESI_TERMS.items():
+            x = values[name]
+            known = np.isfinite(x) & (x > 0)
+            term = weight * np.log1p(-np.abs((x - ref) / (x + ref)))
+            log_sum += np.where(known, term, 0.0)
+            n_terms += known
+        esi = np.exp(log_sum / n_terms)
+        esi[~(np.isfinite(values["radius"]) & np.isfinite(values["temperature"]))] = np.nan
+
+        rocky = ((radius >= 0.5) & (radius <= 1.6)) | ((mass >= 0.1) & (mass <= 3))
+        small = (radius <= 2.5) | (mass <= 10)
+        habitable = np.select([conservative & rocky, optimistic & small], [1.0, 2.0], default=0.0)
+
+        frame = pd.DataFrame({
+            "p_name": _planets_df["pl_name"].astype(object).to_numpy(),
+            "p_esi": esi,
+            "p_habitable": habitable,
+            "p_radius": measured_radius,
+            "p_mass": mass,
+            "p_period": _column(_planets_df, "pl_orbper"),
+            "p_semi_major_axis": sma,
+            "p_flux": insol,
+            "p_temp_equil": teq,
+            "p_detection": _planets_df["discoverymethod"].astype(object).to_numpy(),
+            "p_year": _column(_planets_df, "disc_year"),
+            "s_name": _planets_df["hostname"].astype(object).to_numpy(),
+            "s_type": _planets_df["st_spectype"].astype(object).to_numpy(),
+            "s_distance": _column(_planets_df, "sy_dist"),
+            # Habitable-zone edges in AU: conservative, then optimistic.
+            "hz_inner": np.sqrt(lum / s_eff["runaway_greenhouse"]),
+            "hz_outer": np.sqrt(lum / s_eff["maximum_greenhouse"]),
+            "hz_inner_opt": np.sqrt(lum / s_eff["recent_venus"]),
+            "hz_outer_opt": np.sqrt(lum / s_eff["early_mars"]),
+        })
+    view = habitable_view(frame)
+    view["hab_arch_pos"] = view["frame_pos"]  # rows are the archive's own
+    return view
+
+
+def fmt(value, decimals: int = 2) -> str:
+    """Format a value for display, handling missing data gracefully."""
+    if value is None or value is pd.NA or (
+        isinstance(value, (float, np.floating)) and np.isnan(value)
+    ):
+        return "—"
+    if isinstance(value, (int, np.integer)):
+        return f"{value:,}"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:,.{decimals}f}"
+    return str(value)
+
+
+# ---------------------------------------------------------------------------
+# NASA artwork index (persistent, prefetched in the background)
+# ---------------------------------------------------------------------------
+ARTWORK_PAGE_URL = "https://science.nasa.gov/exoplanet-catalog/{slug}/"
+ARTWORK_DB = os.path.join(PROCESSED_CACHE_DIR, "artwork.sqlite")
+ARTWORK_TTL_DAYS = 30  # found: pick up replaced artwork now and then
+ARTWORK_MISS_TTL_DAYS = 7  # not found: NASA keeps adding planet pages
+ARTWORK_PREFETCH = True
+ARTWORK_PREFETCH_SECONDS = 6 * 3600
+ARTWORK_PREFETCH_RETRY_SECONDS = 15 * 60  # after a pass that failed outright
+ARTWORK_WORKERS = 8
+ARTWORK_MAX_FAILURES = 32  # consecutive network errors before a prefetch pass gives up
+ARTWORK_IMAGE_DIR = "artwork"  # under STATIC_DIR, served at app/static/artwork/
+ARTWORK_IMAGE_WIDTHS = {"thumb": 400, "column": 800}  # variant -> max width (px)
+ARTWORK_IMAGE_CACHE_MB = 100
+ARTWORK_POLL_SECONDS = 0.5  # how often a page waiting on a lookup checks for it
+ARTWORK_DEADLINE_SECONDS = 10  # after this, a page shows no artwork rather than keep waiting
+ARTWORK_SETTLED_SECONDS = 60  # a session reuses a lookup's outcome this long, then asks again
+ARTWORK_SETTLED_MAX = 32  # outcomes remembered per session
+
+
+def artwork_slug(planet_name: str) -> str:
+    """NASA catalog slugs are lowercase with spaces as hyphens,
+    e.g. 'Beta Pictoris d' -> 'beta-pictoris-d'."""
+    return re.sub(r"[^a-z0-9]+", "-", planet_name.lower()).strip("-")
+
+
+@contextmanager
+def artwork_index():
+    """Connection to the on-disk slug -> artwork index, committed on exit.
+
+    One row per catalog page looked up: `image_url` is NULL for pages that
+    don't exist or have no artwork (negative entries); `checked` is the
+    Unix time of the lookup. The database is (re)created on demand, so a
+    deleted index just starts over. Raises sqlite3.Error or OSError if it
+    can't be opened.
+    """
+    os.makedirs(PROCESSED_CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(ARTWORK_DB, timeout=30)
+    try:
+        if conn.execute("select 1 from sqlite_master where name = 'artwork'").fetchone() is None:
+            conn.execute("pragma journal_mode=wal")  # stored in the file from here on
+            conn.execute(
+                "create table if not exists artwork "
+                "(slug text primary key, image_url text, page_url text not null, checked real not null)"
+            )
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _artwork_fresh(image_url, checked: float, now: float) -> bool:
+    ttl_days = ARTWORK_TTL_DAYS if image_url else ARTWORK_MISS_TTL_DAYS
+    return now - checked < ttl_days * 24 * 3600
+
+
+@st.cache_resource(show_spinner=False)
+def artwork_session() -> requests.Session:
+    """Pooled keep-alive session for science.nasa.gov, shared by all threads."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=ARTWORK_WORKERS))
+    session.headers["User-Agent"] = "Mozilla/5.0 (exodashboard; Streamlit app)"
+    return session
+
+
+def resolve_artwork(slug: str):
+    """Look a slug up on NASA's Exoplanet Catalog.
+
+    Returns (image_url, page_url), with image_url None if the page doesn't
+    exist or has no artist's-concept render, or None on network errors and
+    server hiccups, which are not worth remembering.
+    """
+    page_url = ARTWORK_PAGE_URL.format(slug=slug)
+    try:
+        resp = artwork_session().get(page_url, timeout=8)
+    except requests.RequestException:
+        return None
+    if resp.status_code in (404, 410):
+        return None, page_url
+    if resp.status_code != 200:
+        return None
+    match = re.search(
+        r'<meta[^>]+property="og:image"[^>]+content="([^"]+)"', resp.text
+    ) or re.search(
+        r'<meta[^>]+content="([^"]+)"[^>]+property="og:image"', resp.text
+    )
+    if match and "assets.science.nasa.gov" in match.group(1):
+        return match.group(1), page_url
+    return None, page_url
+
+
+def record_artwork(rows: list) -> None:
+    """Store (slug, image_url, page_url, checked) rows in the index."""
+    with artwork_index() as db:
+        db.executemany("insert or replace into artwork values (?, ?, ?, ?)", rows)
+
+
+def indexed_artwork(planet_name: str):
+    """The planet's artwork index entry as (image_url, page_url, checked),
+    or None if it has never been looked up. Never touches the network."""
+    with artwork_index() as db:
+        return db.execute(
+            "select image_url, page_url, checked from artwork where slug = ?",
+            (artwork_slug(planet_name),),
+        ).fetchone()
+
+
+def fetch_nasa_artwork(planet_name: str):
+    """(image_url, page_url) of the planet's artist's-concept render on NASA's
+    Exoplanet Catalog, or None.
+
+    Served from the artwork index; missing or expired entries are looked up
+    and recorded. If that lookup fails, an expired entry is still used; if
+    the index itself is unusable, every call goes to the network.
+    """
+    slug = artwork_slug(planet_name)
+    try:
+        row = indexed_artwork(planet_name)
+    except (sqlite3.Error, OSError):  # unusable index: look it up every time
+        row = None
+    now = time.time()
+    if row is None or not _artwork_fresh(row[0], row[2], now):
+        resolved = resolve_artwork(slug)
+        if resolved is not None:
+            try:
+                record_artwork([(slug, *resolved, now)])
+            except (sqlite3.Error, OSError):
+                pass
+            row = (*resolved, now)
+    if row is None or row[0] is None:
+        return None
+    return row[0], row[1]
+
+
+def prefetch_artwork(planet_names) -> int:
+    """Resolve every planet whose index entry is missing or expired,
+    ARTWORK_WORKERS requests at a time, and return how many were recorded.
+
+    Gives up after ARTWORK_MAX_FAILURES consecutive network errors (upstream
+    down or unreachable); the next pass picks up where this one stopped.
+    """
+    now = time.time()
+    with artwork_index() as db:
+        known = {slug: (image_url, checked) for slug, image_url, checked in db.execute(
+            "select slug, image_url, checked from artwork"
+        )}
+    todo = sorted(
+        slug for slug in {artwork_slug(name) for name in planet_names}
+        if slug and (slug not in known or not _artwork_fresh(*known[slug], now))
+    )
+
+    recorded = failures = 0
+    batch_size = ARTWORK_WORKERS * 4
+    with ThreadPoolExecutor(max_workers=ARTWORK_WORKERS, thread_name_prefix="artwork") as pool:
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            rows = [
+                (slug, *resolved, time.time())
+                for slug, resolved in zip(batch, pool.map(resolve_artwork, batch))
+                if resolved is not None
+            ]
+            if rows:
+                record_artwork(rows)
+            recorded += len(rows)
+            failures = 0 if rows else failures + len(batch)
+            if failures >= ARTWORK_MAX_FAILURES:
+                break
+    return recorded
+
+
+def _artwork_image_names(image_url: str) -> dict:
+    digest = hashlib.sha1(image_url.encode("utf-8")).hexdigest()[:16]
+    ext = "webp" if features.check("webp") else "jpg"
+    return {variant: f"{digest}-{variant}.{ext}" for variant in ARTWORK_IMAGE_WIDTHS}
+
+
+def local_artwork(image_url: str):
+    """app/static URLs of the cached variants of a NASA image, by variant,
+    or None if it hasn't been downloaded (or was evicted). Marks the
+    variants as recently used."""
+    out_dir = os.path.join(STATIC_DIR, ARTWORK_IMAGE_DIR)
+    names = _artwork_image_names(image_url)
+    try:
+        for name in names.values():
+            os.utime(os.path.join(out_dir, name))
+    except OSError:
+        return None
+    return {variant: f"app/static/{ARTWORK_IMAGE_DIR}/{name}" for variant, name in names.items()}
+
+
+def _evict_artwork_images(out_dir: str) -> None:
+    """Delete the least recently used images beyond ARTWORK_IMAGE_CACHE_MB."""
+    files = []
+    with os.scandir(out_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    budget = ARTWORK_IMAGE_CACHE_MB * 1024 * 1024
+    for _, size, path in sorted(files, reverse=True):
+        budget -= size
+        if budget < 0:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def cache_artwork_image(image_url: str):
+    """Download a NASA image once and store it resized to each of
+    ARTWORK_IMAGE_WIDTHS (WebP, or JPEG if Pillow lacks WebP support).
+
+    Returns local_artwork(), or None if the image can't be downloaded or
+    decoded.
+    """
+    cached = local_artwork(image_url)
+    if cached is not None:
+        return cached
+    try:
+        resp = artwork_session().get(image_url, timeout=15)
+        resp.raise_for_status()
+        image = Image.open(BytesIO(resp.content))
+        image = image.convert("RGB")
+    except (requests.RequestException, OSError, Image.DecompressionBombError):
+        return None
+
+    out_dir = os.path.join(STATIC_DIR, ARTWORK_IMAGE_DIR)
+    for variant, name in _artwork_image_names(image_url).items():
+        resized = image.copy()
+        resized.thumbnail((ARTWORK_IMAGE_WIDTHS[variant], image.height), Image.Resampling.LANCZOS)
+        buf = BytesIO()
+        if name.endswith(".webp"):
+            resized.save(buf, "WEBP", quality=80, method=4)
+        else:
+            resized.save(buf, "JPEG", quality=85, optimize=True, progressive=True)
+        write_static_file(out_dir, name, buf.getvalue())
+    _evict_artwork_images(out_dir)
+    return local_artwork(image_url)
+
+
+def load_artwork(planet_name: str):
+    """fetch_nasa_artwork() with the image served from the local cache:
+    ({variant: url}, page_url), or None. Falls back to NASA's own URL if
+    the image can't be cached."""
+    artwork = fetch_nasa_artwork(planet_name)
+    if artwork is None:
+        return None
+    image_url, page_url = artwork
+    try:
+        images = cache_artwork_image(image_url)
+    except OSError:  # static/ not writable
+        images = None
+    return images or {"column": image_url}, page_url
+
+
+@st.cache_resource(show_spinner=False)
+def artwork_lookups() -> dict:
+    """Per-process executor for on-demand artwork lookups, plus the lookups
+    in flight by slug so sessions viewing the same planet share one request."""
+    return {
+        "pool": ThreadPoolExecutor(max_workers=ARTWORK_WORKERS, thread_name_prefix="artwork-lookup"),
+        "pending": {},
+        "lock": threading.Lock(),
+    }
+
+
+def request_artwork(planet_name: str):
+    """Run load_artwork() for the planet in the background and return the
+    future, shared with any other session already waiting on it."""
+    slug = artwork_slug(planet_name)
+    lookups = artwork_lookups()
+
+    def forget(future):
+        with lookups["lock"]:
+            if lookups["pending"].get(slug) is future:
+                del lookups["pending"][slug]
+
+    with lookups["lock"]:
+        future = lookups["pending"].get(slug)
+        submitted = future is None
+        if submitted:
+            future = lookups["pending"][slug] = lookups["pool"].submit(load_artwork, planet_name)
+    if submitted:  # outside the lock: runs inline if the lookup already finished
+        future.add_done_callback(forget)
+    return future
+
+
+def show_artwork(images: dict, page_url: str, link_text: str) -> None:
+    """Artwork image with its credit and a link to the catalog page. The
+    browser picks whichever cached variant suits the column width."""
+    srcset = ", ".join(
+        f"{url} {ARTWORK_IMAGE_WIDTHS[variant]}w" for variant, url in images.items()
+        if variant in ARTWORK_IMAGE_WIDTHS
+    )
+    st.markdown(
+        f'<img class="artwork" src="{images["column"]}" srcset="{srcset}" '
+        'sizes="(max-width: 640px) 100vw, 36vw" alt="Artist\'s concept">',
+        unsafe_allow_html=True,
+    )
+    st.caption(
+        "Artist's concept, representative of this planet type "
+        f"(credit: NASA). [{link_text}]({page_url})."
     )
 
 
-# ---------------------------------------------------------------------------
-# Data loading (no UI calls inside cached functions)
-# ---------------------------------------------------------------------------
-def download_archive() -> bool:
-    """Download today's archive snapshot. Returns True on success."""
+def _settle_artwork(planet_name: str, future):
+    """Remember for this session what a background lookup found (None if
+    it failed or missed the deadline), so the planet isn't polled again
+    for ARTWORK_SETTLED_SECONDS. Keeps the ARTWORK_SETTLED_MAX latest."""
+    artwork = future.result() if future.done() and future.exception() is None else None
+    settled = st.session_state.setdefault("artwork_settled", {})
+    settled.pop(planet_name, None)
+    settled[planet_name] = (artwork, time.monotonic())
+    while len(settled) > ARTWORK_SETTLED_MAX:
+        del settled[next(iter(settled))]
+    return artwork
+
+
+def _settled_artwork(planet_name: str):
+    """This session's recent (artwork, settled_at) outcome for the planet,
+    or None."""
+    outcome = st.session_state.get("artwork_settled", {}).get(planet_name)
+    if outcome is None or time.monotonic() - outcome[1] > ARTWORK_SETTLED_SECONDS:
+        return None
+    return outcome
+
+
+@st.fragment(run_every=ARTWORK_POLL_SECONDS)
+def artwork_loader(planet_name: str, future, deadline: float) -> None:
+    """Wait for a lookup started by request_artwork(), rerunning only this
+    fragment while it is pending. Once it resolves or the deadline passes,
+    one full rerun lays the artwork out and stops the polling."""
+    if future.done() or time.monotonic() >= deadline:
+        _settle_artwork(planet_name, future)
+        st.rerun()
+    st.caption("Looking for NASA artwork…")
+
+
+def artwork_columns(planet_name: str, link_text: str):
+    """Lay out the planet's cards and NASA artwork side by side; returns
+    the container for the cards.
+
+    Never waits on the network: planets already in the artwork index with
+    their image cached locally, or recently looked up in this session, are
+    rendered straight away (expired entries are refreshed in the
+    background); others get an artwork_loader() column until the lookup
+    and download finish.
+    """
     try:
-        response = requests.get(ARCHIVE_URL, timeout=300)
-        if response.status_code == 200:
-            with open(LOCAL_FILE, "wb") as fh:
-                fh.write(response.content)
-            return True
-    except requests.RequestException:
-        pass
-    return False
+        entry = indexed_artwork(planet_name)
+    except (sqlite3.Error, OSError):  # index unreadable: cards without artwork
+        return st.container()
+    images = local_artwork(entry[0]) if entry is not None and entry[0] else None
+    settled = _settled_artwork(planet_name)
+    if entry is not None and (entry[0] is None or images is not None):
+        if not _artwork_fresh(entry[0], entry[2], time.time()):
+            request_artwork(planet_name)
+        artwork = (images, entry[1]) if images is not None else None
+    elif settled is not None:
+        artwork = settled[0]
+    else:
+        future = request_artwork(planet_name)
+        deadline = time.monotonic() + ARTWORK_DEADLINE_SECONDS  # per request, not per lookup
+        if not future.done():
+            col_cards, col_art = st.columns((3, 2), gap="large")
+            with col_art:
+                artwork_loader(planet_name, future, deadline)
+            return col_cards
+        artwork = _settle_artwork(planet_name, future)
+
+    if artwork is None:
+        return st.container()
+    col_cards, col_art = st.columns((3, 2), gap="large")
+    with col_art:
+        show_artwork(*artwork, link_text)
+    return col_cards
+
+
+def _artwork_prefetch_loop(refresher: dict) -> None:
+    refresher["ready"].wait()
+    while True:
+        delay = ARTWORK_PREFETCH_SECONDS
+        try:
+            # One crawler per host: other replicas skip the pass and use
+            # what it records.
+            os.makedirs(PROCESSED_CACHE_DIR, exist_ok=True)
+            with single_flight(ARTWORK_DB, blocking=False) as acquired:
+                if acquired:
+                    names = set()
+                    if refresher["archive"] is not None:
+                        path, date = refresher["archive"]
+                        names.update(load_dataframe(path, str(date))["pl_name"].astype(str))
+                    live_hwc = load_hwc(refresher["hwc"]) if refresher["hwc"] else None
+                    if live_hwc is not None and live_hwc["habitable"] is not None:
+                        names.update(live_hwc["names"])
+                    prefetch_artwork(names)
+        except Exception:  # best effort; lookups fall back to fetching on demand
+            logger.exception("Artwork prefetch pass failed")
+            delay = ARTWORK_PREFETCH_RETRY_SECONDS
+        time.sleep(delay)
+
+
+@st.cache_resource(show_spinner=False)
+def start_artwork_prefetcher() -> threading.Thread:
+    """Start the per-process thread that keeps the artwork index populated
+    for every planet in the live archive and HWC snapshots."""
+    thread = threading.Thread(
+        target=_artwork_prefetch_loop, args=(start_refresher(),), name="artwork-prefetcher", daemon=True
+    )
+    thread.start()
+    return thread
 
 
-def categorize_by_size_and_mass(radius: pd.Series, mass: pd.Series) -> np.ndarray:
-    conditions = [
-        (radius > 4.5) | (mass >= 159),
-        ((radius > 2.1) & (radius <= 4.5)) | ((mass >= 10) & (mass < 159)),
-        ((radius > 1.0) & (radius <= 2.1)) | ((mass >= 1) & (mass < 10)),
-        ((radius > 0.1) & (radius <= 1.0)) | ((mass > 0.1) & (mass < 1)),
-    ]
-    return np.select(conditions, CATEGORY_ORDER, default="unclassified")
+# ---------------------------------------------------------------------------
+# Background refresher (stale-while-revalidate)
+# ---------------------------------------------------------------------------
+REFRESH_CHECK_SECONDS = 15 * 60
+REFRESH_RETRY_SECONDS = 60  # first retry after a failed refresh, doubling from there
+REFRESH_MAX_BACKOFF_SECONDS = 3600
 
 
-@st.cache_data(show_spinner=False)
-def load_dataframe(csv_file: str, cache_key: str) -> pd.DataFrame:
-    """Load the archive CSV, keep default parameter sets, add categories.
+@st.cache_resource(show_spinner=False)
+def _refresh_lock(name: str) -> threading.Lock:
+    return threading.Lock()
 
-    `cache_key` (the snapshot date) makes the cache refresh when new data
-    is downloaded.
-    """
-    df = pd.read_csv(csv_file, low_memory=False)
 
-    if "default_flag" in df.columns:
-        df = df[df["default_flag"] > 0]
+@contextmanager
+def single_flight(path: str, blocking: bool = True):
+    """Serialise refreshes of `path` across threads and worker processes.
 
-    df = df.reset_index(drop=True).copy()
-    df.index += 1
+    Holds an in-process lock plus an exclusive flock on `<path>.lock`, so
+    exactly one download of a file runs at a time; everyone else blocks here
+    and should re-check freshness once inside, where they usually find the
+    winner's result already on disk. The file lock is skipped on platforms
+    without fcntl.
 
-    df["category"] = categorize_by_size_and_mass(df["pl_rade"], df["pl_bmasse"])
-    df["pl_name_lower"] = df["pl_name"].str.lower()
-    return df
+    With blocking=False, yields False straight away if the lock is held
+    elsewhere (and True once acquired), for work that can simply be skipped.
+    """
+    lock = _refresh_lock(path)
+    if not lock.acquire(blocking=blocking):
+        yield False
+        return
+    try:
+        with open(f"{path}.lock", "a") as fh:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            try:
+                yield True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+    finally:
+        lock.release()
 
 
-def ensure_data() -> tuple[str, datetime.date]:
-    """Make sure we have a data file; download a fresh one if outdated."""
-    today = datetime.date.today()
-
-    if os.path.exists(LOCAL_FILE):
-        mod_date = datetime.date.fromtimestamp(os.path.getmtime(LOCAL_FILE))
-        if mod_date == today:
-            return LOCAL_FILE, mod_date
-        with st.spinner("A newer snapshot is available — downloading today's NASA Exoplanet Archive…"):
-            if download_archive():
-                return LOCAL_FILE, today
-        return LOCAL_FILE, mod_date  # keep the outdated copy if download failed
-
-    with st.spinner("Downloading the NASA Exoplanet Archive (first run can take a minute)…"):
-        if download_archive():
-            return LOCAL_FILE, today
-
-    # Fall back to the snapshot bundled with the repository
-    mod_date = datetime.date.fromtimestamp(os.path.getmtime(FALLBACK_FILE))
-    st.warning(
-        "Could not reach the NASA Exoplanet Archive. "
-        f"Showing the bundled snapshot from {mod_date}."
+def archive_is_current() -> bool:
+    """True if the downloaded archive snapshot is from today."""
+    return (
+        os.path.exists(LOCAL_FILE)
+        and datetime.date.fromtimestamp(os.path.getmtime(LOCAL_FILE)) == datetime.date.today()
     )
-    return FALLBACK_FILE, mod_date
 
 
-def fmt(value, decimals: int = 2) -> str:
-    """Format a value for display, handling missing data gracefully."""
-    if value is None or (isinstance(value, float) and np.isnan(value)):
-        return "—"
-    if isinstance(value, (int, np.integer)):
-        return f"{value:,}"
-    if isinstance(value, (float, np.floating)):
-        return f"{value:,.{decimals}f}"
-    return str(value)
+def refresh_snapshots(state: dict) -> None:
+    """Refresh the archive and HWC files if outdated, then make them live.
+
+    New snapshots are loaded into the load_dataframe / load_hwc caches before
+    they replace the live entry, so sessions switch over in a single step and
+    never wait on a download or a cold parse.
+    """
+    if not archive_is_current():
+        state["refreshing"].add("archive")
+        try:
+            with single_flight(LOCAL_FILE):
+                if not archive_is_current():  # another process may have won
+                    refresh_archive() if os.path.exists(LOCAL_FILE) else download_archive()
+        finally:
+            state["refreshing"].discard("archive")
+    on_disk = archive_on_disk()
+    if on_disk is not None and on_disk != state["archive"]:
+        load_dataframe(on_disk[0], str(on_disk[1]))
+        state["archive"] = on_disk
+
+    if not hwc_is_current():
+        state["refreshing"].add("hwc")
+        try:
+            with single_flight("hwc.csv"):
+                if not hwc_is_current():
+                    download_hwc()  # on failure, the existing copy stays in place
+        finally:
+            state["refreshing"].discard("hwc")
+    hwc_key = hwc_on_disk()
+    if hwc_key and hwc_key != state["hwc"]:
+        load_hwc(hwc_key)
+        state["hwc"] = hwc_key
+
+
+def _refresh_loop(state: dict) -> None:
+    failures = 0
+    while True:
+        state["wake"].clear()  # a wake-up during this pass triggers the next one
+        try:
+            refresh_snapshots(state)
+            refreshed = archive_is_current() and hwc_is_current()
+        except Exception:  # keep serving the last good snapshot
+            refreshed = False
+        failures = 0 if refreshed else failures + 1
+        state["checked"] = datetime.datetime.now()
+        state["ready"].set()
+        if failures:
+            # Upstream is down or unreachable: back off, and don't let the
+            # wake-ups every page view sends cut the wait short.
+            time.sleep(min(REFRESH_RETRY_SECONDS * 2 ** (failures - 1), REFRESH_MAX_BACKOFF_SECONDS))
+        else:
+            state["wake"].wait(REFRESH_CHECK_SECONDS)
 
 
-@st.cache_data(show_spinner=False, ttl=7 * 24 * 3600, max_entries=500)
-def fetch_nasa_artwork(planet_name: str):
-    """Look up the planet's page on NASA's Exoplanet Catalog and return
-    (image_url, page_url) for its artist's-concept render, or None.
+@st.cache_resource(show_spinner=False)
+def start_refresher() -> dict:
+    """Start the per-process refresher thread and return its shared state.
 
-    NASA catalog slugs are lowercase with spaces as hyphens,
-    e.g. 'Beta Pictoris d' -> 'beta-pictoris-d'.
+    `archive` / `hwc` hold the live snapshot, i.e. what ensure_data() and
+    ensure_hwc() hand out; they start as whatever is already on disk.
     """
-    import re as _re
-
-    slug = _re.sub(r"[^a-z0-9]+", "-", planet_name.lower()).strip("-")
-    page_url = f"https://science.nasa.gov/exoplanet-catalog/{slug}/"
-    try:
-        resp = requests.get(
-            page_url,
-            timeout=8,
-            headers={"User-Agent": "Mozilla/5.0 (exodashboard; Streamlit app)"},
-        )
-        if resp.status_code != 200:
-            return None
-        match = _re.search(
-            r'<meta[^>]+property="og:image"[^>]+content="([^"]+)"', resp.text
-        ) or _re.search(
-            r'<meta[^>]+content="([^"]+)"[^>]+property="og:image"', resp.text
-        )
-        if match and "assets.science.nasa.gov" in match.group(1):
-            return match.group(1), page_url
-    except requests.RequestException:
-        pass
-    return None
+    state = {
+        "archive": archive_on_disk(),
+        "hwc": hwc_on_disk(),
+        "refreshing": set(),
+        "checked": None,
+        "wake": threading.Event(),
+        "ready": threading.Event(),
+    }
+    threading.Thread(
+        target=_refresh_loop, args=(state,), name="snapshot-refresher", daemon=True
+    ).start()
+    return state
 
 
 data_file, snapshot_date = ensure_data()
-planets_df = load_dataframe(data_file, str(snapshot_date))
+archive_df = load_dataframe(data_file, str(snapshot_date))
+snapshot_key = f"{data_file}:{snapshot_date}"
+# The scheme picker lives in the sidebar; its value is read here so every
+# category-dependent structure below is built for it.
+scheme = st.session_state.get("classification_scheme", DEFAULT_SCHEME)
+planets_df = load_classified(archive_df, scheme, snapshot_key)
+classified_key = f"{snapshot_key}:{scheme}"
+aggregates = load_aggregates(planets_df, classified_key)
+lookups = load_lookups(archive_df, snapshot_key)
+search = load_search_index(archive_df, snapshot_key)
+hwc_key = ensure_hwc()
+hwc = load_hwc(hwc_key)
+crossmatch = (
+    load_crossmatch(archive_df, hwc, f"{snapshot_key}|{hwc_key}")
+    if hwc is not None and hwc["habitable"] is not None
+    else None
+)
+habitability = load_habitability(archive_df, snapshot_key)
+if ARTWORK_PREFETCH:
+    start_artwork_prefetcher()
 
 
 # ---------------------------------------------------------------------------
@@ -315,14 +2161,32 @@ with st.sidebar:
     </style>
     """
 
+    refreshing = start_refresher()["refreshing"]
+    refresh_note = " · <i>updating in the background…</i>" if refreshing else ""
     sb_header_html = (
         '<div class="sb-title">🪐 <span class="sb-grad">Exoplanet Population Dashboard</span></div>'
         '<div class="sb-caption">Data: <a href="https://exoplanetarchive.ipac.caltech.edu/index.html" '
-        f'target="_blank">NASA Exoplanet Archive</a> · snapshot of <b>{snapshot_date}</b></div>'
+        f'target="_blank">NASA Exoplanet Archive</a> · snapshot of <b>{snapshot_date}</b>'
+        f"{refresh_note}</div>"
         '<div class="sb-stat"><div class="sb-stat-label">Confirmed exoplanets</div>'
         f'<div class="sb-stat-value">{len(planets_df):,}</div></div>'
     )
     st.markdown(textwrap.dedent(SIDEBAR_HEADER_CSS) + sb_header_html, unsafe_allow_html=True)
+    footprint = planets_df.attrs.get("memory_footprint")
+    if footprint:
+        st.caption(
+            f"Planet table in memory: {footprint['after'] / 1e6:,.1f} MB "
+            f"(compacted from {footprint['before'] / 1e6:,.1f} MB)"
+        )
+
+    st.selectbox(
+        "Classification scheme",
+        list(CLASSIFICATION_SCHEMES),
+        format_func=lambda key: CLASSIFICATION_SCHEMES[key]["label"],
+        key="classification_scheme",
+        help="How planets are sorted into categories across the dashboard; "
+        "see “How are planets categorised?” in Population statistics.",
+    )
 
     st.divider()
 
@@ -390,85 +2254,226 @@ with st.sidebar:
 
 
 # ---------------------------------------------------------------------------
-# Tabs
+# Exports (serialised only when a download button is clicked)
 # ---------------------------------------------------------------------------
-HWC_URL = "https://www.hpcf.upr.edu/~abel/phl/hwc/data/hwc.csv"
-HWC_FILES = ("hwc.csv", "hwc_full.csv", "hwc_simplified.csv")
-HWC_MAX_AGE_DAYS = 7
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Feather": ("feather", "application/vnd.apache.arrow.file"),
+}
+ARROW_EXPORTS = ("Parquet", "Feather")
 
 
-def download_hwc() -> bool:
-    """Download a fresh HWC snapshot from PHL. Returns True on success.
+@st.cache_data(show_spinner=False, max_entries=32)
+def export_bytes(_make_frame, cache_key: str, fmt_name: str, index_label=None) -> bytes:
+    """Serialise `_make_frame()` as `fmt_name`, cached per (cache_key, format).
 
-    Validates the payload looks like the catalog (header contains P_NAME)
-    before overwriting, so a server error page never clobbers good data.
+    `cache_key` must identify the snapshot and the selection the frame was
+    built from. The index is written as `index_label`, or dropped if None.
     """
-    try:
-        resp = requests.get(HWC_URL, timeout=120)
-        if resp.status_code == 200 and b"P_NAME" in resp.content[:2000].upper():
-            with open("hwc.csv", "wb") as fh:
-                fh.write(resp.content)
-            return True
-    except requests.RequestException:
-        pass
-    return False
+    df = _make_frame()
+    if fmt_name in ARROW_EXPORTS:
+        df = df.reset_index(names=index_label) if index_label else df.reset_index(drop=True)
+        buf = BytesIO()
+        if fmt_name == "Parquet":
+            df.to_parquet(buf, index=False)
+        else:
+            df.to_feather(buf)
+        return buf.getvalue()
 
+    csv = df.to_csv(index=index_label is not None, index_label=index_label).encode("utf-8")
+    return gzip.compress(csv) if fmt_name == "CSV (gzip)" else csv
 
-def ensure_hwc() -> str:
-    """Keep hwc.csv fresh (<= HWC_MAX_AGE_DAYS old); fall back gracefully.
 
-    Returns a cache key derived from the file that will be used, or ''
-    if no HWC data is available at all.
+def export_menu(label: str, make_frame, cache_key: str, file_stem: str, index_label=None) -> None:
+    """Popover with one download button per export format.
+
+    Each button defers to export_bytes(), so widget changes elsewhere in the
+    app never pay for serialising a table nobody downloads.
     """
-    today = datetime.date.today()
-    if os.path.exists("hwc.csv"):
-        age_days = (today - datetime.date.fromtimestamp(os.path.getmtime("hwc.csv"))).days
-        if age_days > HWC_MAX_AGE_DAYS:
-            with st.spinner("Refreshing the Habitable Worlds Catalog from PHL…"):
-                download_hwc()  # on failure, the existing copy stays in place
-    else:
-        with st.spinner("Downloading the Habitable Worlds Catalog from PHL…"):
-            download_hwc()
+    with st.popover(label):
+        for fmt_name, (ext, mime) in EXPORT_FORMATS.items():
+            if fmt_name in ARROW_EXPORTS and pyarrow is None:
+                continue
+            st.download_button(
+                label=fmt_name,
+                data=functools.partial(export_bytes, make_frame, cache_key, fmt_name, index_label),
+                file_name=f"{file_stem}.{ext}",
+                mime=mime,
+                key=f"export-{file_stem}-{ext}",
+                on_click="ignore",
+                width="stretch",
+            )
 
-    for path in HWC_FILES:
-        if os.path.exists(path):
-            return f"{path}:{os.path.getmtime(path)}"
-    return ""
 
+# Chart datasets are written once as content-hashed JSON under static/ (served
+# at app/static/ when server.enableStaticServing is on) and referenced by URL,
+# so reruns send only the spec and browsers cache the data.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+CHART_DATA_DIR = "charts"
+CHART_DATA_KEEP = 200
+
+
+def write_static_file(out_dir: str, name: str, payload: bytes) -> None:
+    """Atomically write `payload` to out_dir/name, world-readable so the
+    static file server can send it."""
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(payload)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates it owner-only
+        os.replace(tmp_path, os.path.join(out_dir, name))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_chart_data(df: pd.DataFrame) -> str:
+    """Write `df` as JSON records named by its content hash, pruning old
+    files, and return its app/static URL."""
+    payload = df.to_json(orient="records", double_precision=6).encode("utf-8")
+    name = f"{hashlib.sha1(payload).hexdigest()[:16]}.json"
+    out_dir = os.path.join(STATIC_DIR, CHART_DATA_DIR)
+    if not os.path.exists(os.path.join(out_dir, name)):
+        write_static_file(out_dir, name, payload)
+
+        written = sorted(
+            (os.path.join(out_dir, f) for f in os.listdir(out_dir) if f.endswith(".json")),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for stale in written[CHART_DATA_KEEP:]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return f"app/static/{CHART_DATA_DIR}/{name}"
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def chart_data_url(_df: pd.DataFrame, cache_key: str):
+    """write_chart_data(), once per `cache_key` (snapshot + selection).
+    None if the file can't be written."""
+    try:
+        return write_chart_data(_df)
+    except OSError:
+        return None
 
-@st.cache_data(show_spinner=False)
-def load_hwc(cache_key: str):
-    """Load the PHL Habitable Worlds Catalog CSV.
 
-    Column names have varied across HWC releases (p_name vs P_NAME etc.),
-    so downstream code resolves columns case-insensitively.
+def chart_data(df: pd.DataFrame, cache_key: str):
+    """Data for alt.Chart: a URL to the static copy of `df`, or `df` itself
+    (inline in the spec) when static serving is off or the disk is read-only.
+
+    Specs using it must type every encoded field, as Altair can't infer types
+    from a URL.
     """
-    for path in HWC_FILES:
-        if os.path.exists(path):
-            return pd.read_csv(path, low_memory=False)
-    return None
+    if not st.get_option("server.enableStaticServing"):
+        return df
+    url = chart_data_url(df, cache_key)
+    if url is not None and not os.path.exists(os.path.join(STATIC_DIR, url.removeprefix("app/static/"))):
+        try:
+            url = write_chart_data(df)  # pruned since it was cached
+        except OSError:
+            url = None
+    return df if url is None else alt.UrlData(url, format=alt.DataFormat(type="json"))
+
+
+SCATTER_POINT_LIMIT = 2000  # above this, tab 3 opens on the binned density map
+CATEGORY_SCALE = alt.Scale(
+    domain=[CATEGORY_LABELS[c] for c in CATEGORY_ORDER],
+    range=[CATEGORY_COLORS[CATEGORY_LABELS[c]] for c in CATEGORY_ORDER],
+)
+ORBIT_AXIS = {"scale": alt.Scale(type="log"), "title": "Semi-major axis (AU)"}
+MASS_AXIS = {"scale": alt.Scale(type="log"), "title": "Mass (Earth masses)"}
 
 
-def hwc_col(df: pd.DataFrame, *candidates: str):
-    """Return the first column matching any candidate name, case-insensitively."""
-    lookup = {c.lower(): c for c in df.columns}
-    for cand in candidates:
-        if cand.lower() in lookup:
-            return lookup[cand.lower()]
-    return None
+def scatter_points_chart(points, title: str) -> alt.Chart:
+    """Log–log Mass vs orbit scatter, one point per planet (`points` may be
+    a frame or chart_data() URL)."""
+    return (
+        alt.Chart(points)
+        .mark_circle(size=45, opacity=0.55)
+        .encode(
+            x=alt.X("pl_orbsmax:Q", **ORBIT_AXIS),
+            y=alt.Y("pl_bmasse:Q", **MASS_AXIS),
+            color=alt.Color("Category:N", scale=CATEGORY_SCALE, legend=alt.Legend(orient="bottom")),
+            tooltip=[
+                alt.Tooltip("pl_name:N", title="Planet"),
+                alt.Tooltip("Category:N"),
+                alt.Tooltip("pl_orbsmax:Q", title="Semi-major axis (AU)", format=".3f"),
+                alt.Tooltip("pl_bmasse:Q", title="Mass (M⊕)", format=",.2f"),
+            ],
+        )
+        .interactive()
+        .properties(height=520, title=title)
+    )
 
 
-def hwc_num(row, colname, decimals: int = 2) -> str:
-    """Numeric HWC field -> display string ('—' when missing/non-numeric)."""
-    if colname is None:
-        return "—"
-    val = pd.to_numeric(pd.Series([row[colname]]), errors="coerce").iloc[0]
-    return fmt(float(val), decimals) if pd.notna(val) else "—"
+def scatter_density_chart(density, title: str) -> alt.Chart:
+    """Log–log binned density of the same plane; a brush named `region`
+    selects an area to show as individual points."""
+    return (
+        alt.Chart(density)
+        .mark_rect()
+        .encode(
+            x=alt.X("pl_orbsmax:Q", **ORBIT_AXIS),
+            x2="pl_orbsmax_hi:Q",
+            y=alt.Y("pl_bmasse:Q", **MASS_AXIS),
+            y2="pl_bmasse_hi:Q",
+            color=alt.Color("Category:N", scale=CATEGORY_SCALE, legend=alt.Legend(orient="bottom")),
+            opacity=alt.Opacity("Planets:Q", scale=alt.Scale(type="log", range=[0.3, 1]), legend=None),
+            tooltip=[
+                alt.Tooltip("Category:N", title="Most common category"),
+                alt.Tooltip("Planets:Q", format=","),
+            ],
+        )
+        .add_params(alt.selection_interval(name="region", encodings=["x", "y"]))
+        .properties(height=520, title=title)
+    )
+
+
+def render_scatter_png(scatter_df: pd.DataFrame, selected_label: str) -> bytes:
+    # A bare Figure renders through Agg and keeps no pyplot global state,
+    # so it is safe to draw from the threads deferred downloads run in.
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    for cat in scatter_df["Category"].unique():
+        sub = scatter_df[scatter_df["Category"] == cat]
+        ax.scatter(
+            sub["pl_orbsmax"], sub["pl_bmasse"],
+            s=12, alpha=0.55, label=cat,
+            color=CATEGORY_COLORS[cat],
+        )
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("Semi-major axis (AU)")
+    ax.set_ylabel("Mass (Earth masses)")
+    ax.set_title(f"Mass vs semi-major axis — {selected_label}")
+    ax.legend()
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=150, bbox_inches="tight")
+    return buf.getvalue()
 
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def scatter_png(_scatter_df: pd.DataFrame, cache_key: str, selected_label: str) -> bytes:
+    """PNG of the Mass vs orbit scatter, cached per (snapshot, category) key
+    with bounded eviction. Only called when the download is clicked, which
+    Streamlit serves off the event loop."""
+    return render_scatter_png(_scatter_df, selected_label)
+
+
+# ---------------------------------------------------------------------------
+# Tabs
+# ---------------------------------------------------------------------------
 PC_TO_LY = 3.26156
+STAR_COLOR = "#e8c468"
 
 
+# Only the open tab runs (switching tabs is a full rerun), and each tab is a
+# fragment, so its own widgets rerun just that tab.
 tab4, tab1, tab2, tab5, tab3 = st.tabs(
     [
         "🛰️ Detection methods",
@@ -476,42 +2481,52 @@ tab4, tab1, tab2, tab5, tab3 = st.tabs(
         "🔎 Planet explorer",
         "🌿 Habitable exoplanets explorer",
         "🌌 Mass vs orbit",
-    ]
+    ],
+    key="active_tab",
+    on_change="rerun",
 )
 
 
 # ---------------------------------------------------------------------------
 # Tab 1 — Population statistics by detection method
 # ---------------------------------------------------------------------------
-with tab1:
-    method_list = ["All"] + sorted(planets_df["discoverymethod"].dropna().unique())
+@st.fragment
+def population_tab() -> None:
+    """Population statistics by detection method."""
     selected_method = st.selectbox(
         "Detection method",
-        method_list,
+        aggregates["methods"],
         index=0,
         help="Filter the population by the technique used to discover each planet.",
     )
 
     if selected_method == "All":
-        df_selected = planets_df
         chart_title = "All confirmed exoplanets by category"
     else:
-        df_selected = planets_df[planets_df["discoverymethod"] == selected_method]
         chart_title = f"Exoplanets discovered by {selected_method}, by category"
 
-    category_counts = (
-        df_selected["category"].value_counts().reindex(
-            CATEGORY_ORDER + ["unclassified"], fill_value=0
-        )
+    category_counts = aggregates["category_counts"][selected_method]
+    with_uncertainty = st.toggle(
+        "Account for measurement uncertainties",
+        key="category_uncertainty",
+        help=f"Classify {MC_SAMPLES} random draws of each planet's radius and mass "
+        "within their reported errors, and show the expected count per category.",
     )
+    expected = None
+    if with_uncertainty:
+        with st.spinner("Sampling measurement uncertainties…"):
+            expected = load_category_uncertainty(planets_df, scheme, classified_key)["expected"][selected_method]
 
     # --- Category cards (labels and values always paired correctly) ---
     cards = [
         category_card(
             CATEGORY_ICONS[CATEGORY_LABELS[cat]],
             CATEGORY_LABELS[cat],
-            f"{count:,}",
+            f"{count:,}" if expected is None else f"{expected.at[cat, 'expected']:,.0f}",
             CATEGORY_COLORS[CATEGORY_LABELS[cat]],
+            note=""
+            if expected is None
+            else f"95% CI {expected.at[cat, 'low']:,.0f}–{expected.at[cat, 'high']:,.0f} · {count:,} at face value",
         )
         for cat, count in category_counts.items()
     ]
@@ -524,6 +2539,12 @@ with tab1:
         CARD_CSS + '<div class="cat-row">' + "".join(cards) + "</div>",
         unsafe_allow_html=True,
     )
+    if expected is not None:
+        st.caption(
+            "Expected counts treat each planet's radius and mass errors as an asymmetric "
+            "normal distribution; planets near a category boundary count partly towards "
+            "both. Planets without reported errors count at face value."
+        )
 
     st.divider()
 
@@ -536,51 +2557,37 @@ with tab1:
 
         with st.expander("How are planets categorised?"):
             st.markdown(
-                "Categories use radius (Earth radii) **or** mass (Earth masses):\n\n"
-                "| Category | Radius | Mass |\n"
-                "|---|---|---|\n"
-                "| Gas giants | > 4.5 | ≥ 159 |\n"
-                "| Ice giants | 2.1 – 4.5 | 10 – 159 |\n"
-                "| Super-Earths | 1.0 – 2.1 | 1 – 10 |\n"
-                "| Terrestrial | 0.1 – 1.0 | 0.1 – 1 |\n\n"
+                f"Categories use {CLASSIFICATION_SCHEMES[scheme]['basis']} "
+                "(pick another scheme in the sidebar):\n\n"
+                + scheme_table(scheme)
+                + "\n\nA planet takes the first category it matches, from the top. "
                 "Planets with insufficient radius and mass data are *unclassified* "
                 "and excluded from the chart."
             )
 
     with col_right:
-        chart_data = (
-            category_counts.drop("unclassified")
-            .rename(index=CATEGORY_LABELS)
-            .rename_axis("Category")
-            .reset_index(name="Planets")
-        )
-        chart_data = chart_data[chart_data["Planets"] > 0]
+        category_chart = aggregates["category_charts"][selected_method]
 
-        if chart_data.empty:
+        if category_chart.empty:
             st.info("No categorised planets for this detection method yet.")
         else:
-            chart_data["Percentage"] = (
-                chart_data["Planets"] / chart_data["Planets"].sum() * 100
-            )
-            chart_data["pct_label"] = chart_data["Percentage"].map(
-                lambda p: f"{p:.1f}%"
-            )
-
             color_scale = alt.Color(
                 "Category:N",
                 scale=alt.Scale(
-                    domain=list(chart_data["Category"]),
-                    range=[CATEGORY_COLORS[c] for c in chart_data["Category"]],
+                    domain=list(category_chart["Category"]),
+                    range=[CATEGORY_COLORS[c] for c in category_chart["Category"]],
                 ),
                 legend=alt.Legend(orient="right", title=None),
             )
             tooltip = [
-                "Category:N",
+                alt.Tooltip("Category:N"),
                 alt.Tooltip("Planets:Q", format=","),
                 alt.Tooltip("Percentage:Q", format=".1f", title="Percentage (%)"),
             ]
 
-            base = alt.Chart(chart_data).encode(
+            base = alt.Chart(
+                chart_data(category_chart, f"{classified_key}:category_chart:{selected_method}")
+            ).encode(
                 theta=alt.Theta("Planets:Q", stack=True),
                 color=color_scale,
                 tooltip=tooltip,
@@ -597,32 +2604,48 @@ with tab1:
             st.altair_chart(donut, width="stretch")
             st.caption("*Unclassified exoplanets are not included in the chart. Hover a slice for exact counts.")
 
-    st.download_button(
-        label="⬇️ Download this selection as CSV",
-        data=df_selected.to_csv(index_label="ID").encode("utf-8"),
-        file_name=f"{selected_method}_confirmed_exoplanets.csv",
-        mime="text/csv",
+    export_menu(
+        "⬇️ Download this selection",
+        lambda df=planets_df, method=selected_method: (
+            df if method == "All" else df[df["discoverymethod"] == method]
+        ),
+        f"{classified_key}:method:{selected_method}",
+        f"{selected_method}_confirmed_exoplanets",
+        index_label="ID",
     )
 
 
 # ---------------------------------------------------------------------------
 # Tab 2 — Planet explorer
 # ---------------------------------------------------------------------------
-with tab2:
-    planet_names = sorted(planets_df["pl_name"].dropna().unique())
-    default_planet = "Kepler-167 e"
-    default_index = (
-        planet_names.index(default_planet) if default_planet in planet_names else 0
+@st.fragment
+def explorer_tab() -> None:
+    """Planet explorer."""
+    planet_query = st.text_input(
+        "Find a planet by name or catalog designation",
+        placeholder="e.g. Kepler-22 b, HD 209458, HIP 65426 b, TIC 25155310",
+        help="Matches planet names and their HD, HIP, TIC and Gaia designations; "
+        "tolerates typos.",
     )
+    planet_options, planet_index = lookups["planet_names"], lookups["default_index"]
+    if planet_query.strip():
+        matches = search_index(search, planet_query)
+        if matches:
+            planet_options, planet_index = matches, 0
+        else:
+            st.caption(f"No planets match “{planet_query}” — showing the full list.")
 
     selected_planet = st.selectbox(
         "Search for an exoplanet",
-        planet_names,
-        index=default_index,
+        planet_options,
+        index=planet_index,
         help="Start typing to search the full list of confirmed exoplanets.",
     )
 
-    row = planets_df[planets_df["pl_name"] == selected_planet].iloc[0]
+    planet_pos = lookups["planet_pos"][selected_planet]
+    row = planets_df.iloc[planet_pos]
+    hwc_match = crossmatch["hwc_pos"][planet_pos] if crossmatch is not None else -1
+    hwc_row = hwc["frame"].iloc[hwc_match] if hwc_match >= 0 else None
 
     cat_label = CATEGORY_LABELS.get(row["category"], row["category"])
     cat_color = CATEGORY_COLORS.get(cat_label, "#8a8a8a")
@@ -634,7 +2657,13 @@ with tab2:
         f'<div class="pl-title">{selected_planet}</div>'
         f'<div class="pl-meta">Detected by <b>{row["discoverymethod"]}</b> · '
         f'Discovered in <b>{"—" if pd.isna(row.get("disc_year")) else int(row["disc_year"])}</b>'
-        f'<span class="pl-chip" style="--accent:{cat_color}">{cat_icon} {cat_label}</span></div>'
+        f'<span class="pl-chip" style="--accent:{cat_color}">{cat_icon} {cat_label}</span>'
+        + (
+            '<span class="pl-chip" style="--accent:#7bc86c">🌿 Potentially habitable</span>'
+            if hwc_row is not None and hwc_row.get("p_habitable", 0) > 0
+            else ""
+        )
+        + "</div>"
     )
     st.markdown(CARD_CSS + header_html, unsafe_allow_html=True)
 
@@ -652,7 +2681,6 @@ with tab2:
         "</g></svg>"
     )
 
-    STAR_COLOR = "#e8c468"
     planet_cards = [
         category_card("📏", "Radius (Earth radii)", fmt(row["pl_rade"]), cat_color),
         category_card("🌍", "Mass (Earth masses)", fmt(row["pl_bmasse"]), cat_color),
@@ -670,20 +2698,7 @@ with tab2:
         category_card("🌈", "Star spectral type", fmt(row["st_spectype"]), STAR_COLOR, small=True),
         category_card("☀️", "Star effective temp. (K)", fmt(row["st_teff"], 0), STAR_COLOR),
     ]
-    artwork = fetch_nasa_artwork(selected_planet)
-
-    if artwork:
-        img_url, nasa_page = artwork
-        col_cards, col_art = st.columns((3, 2), gap="large")
-        with col_art:
-            st.image(img_url, width="stretch")
-            st.caption(
-                "Artist's concept, representative of this planet type "
-                "(credit: NASA). "
-                f"[Explore the interactive 3D model on NASA's catalog]({nasa_page})."
-            )
-    else:
-        col_cards = st.container()
+    col_cards = artwork_columns(selected_planet, "Explore the interactive 3D model on NASA's catalog")
 
     with col_cards:
         st.markdown(
@@ -691,142 +2706,144 @@ with tab2:
             '<div class="cat-row">' + "".join(star_cards) + "</div>",
             unsafe_allow_html=True,
         )
+        if hwc_row is not None:
+            hwc_sample = {1: "conservative", 2: "optimistic"}.get(hwc_row.get("p_habitable"))
+            st.caption(
+                f"Habitable Worlds Catalog: Earth Similarity Index {hwc_num(hwc_row, 'p_esi')}"
+                + (f", in the {hwc_sample} habitable sample" if hwc_sample else "")
+                + " (PHL @ UPR Arecibo)."
+            )
 
     st.divider()
-    with st.expander("Look up any other parameter for this planet"):
-        column_list = [
-            c for c in planets_df.columns if c not in ("pl_name_lower", "category")
-        ]
-        default_col = column_list.index("pl_orbper") if "pl_orbper" in column_list else 0
-        selected_column = st.selectbox(
-            "Archive column", column_list, index=default_col
-        )
-        st.markdown(
-            '<div class="cat-row">'
-            + category_card("🔭", selected_column, fmt(row[selected_column]), "#b8a2e3", small=True)
-            + "</div>",
-            unsafe_allow_html=True,
-        )
+    # Only fetched when opened: with projected ingest the rarer columns come
+    # from the archive, one planet at a time.
+    with st.expander(
+        "Look up any other parameter for this planet", key="param_lookup", on_change="rerun"
+    ) as param_expander:
+        if param_expander.open:
+            param_row = None
+            if PROJECTED_INGEST:
+                try:
+                    param_row = fetch_planet_parameters(selected_planet)
+                except (requests.RequestException, ValueError):
+                    st.caption(
+                        "Couldn't reach the NASA Exoplanet Archive — showing the "
+                        "parameters in the local snapshot only."
+                    )
+                    st.button("Try again", key="param_lookup_retry")
+            if param_row is None:
+                param_row = row
+            column_list = [
+                c for c in param_row.index if c != "category"
+            ]
+            default_col = column_list.index("pl_orbper") if "pl_orbper" in column_list else 0
+            selected_column = st.selectbox(
+                "Archive column", column_list, index=default_col
+            )
+            st.markdown(
+                '<div class="cat-row">'
+                + category_card("🔭", selected_column, fmt(param_row[selected_column]), "#b8a2e3", small=True)
+                + "</div>",
+                unsafe_allow_html=True,
+            )
 
 
 # ---------------------------------------------------------------------------
 # Tab 3 — Mass vs semi-major axis
 # ---------------------------------------------------------------------------
-with tab3:
+@st.fragment
+def mass_orbit_tab() -> None:
+    """Mass vs semi-major axis."""
     categories_available = ["All categories"] + [
         CATEGORY_LABELS[c] for c in CATEGORY_ORDER
     ]
-    label_to_key = {v: k for k, v in CATEGORY_LABELS.items()}
-
     ctrl_cols = st.columns((2, 3))
     with ctrl_cols[0]:
         selected_label = st.selectbox("Planet category", categories_available, index=0)
 
-    scatter_df = planets_df[["pl_name", "category", "pl_orbsmax", "pl_bmasse"]].copy()
-    scatter_df = scatter_df.dropna(subset=["pl_orbsmax", "pl_bmasse"])
-    scatter_df = scatter_df[(scatter_df["pl_orbsmax"] > 0) & (scatter_df["pl_bmasse"] > 0)]
-    scatter_df = scatter_df[scatter_df["category"] != "unclassified"]
-    scatter_df["Category"] = scatter_df["category"].map(CATEGORY_LABELS)
-
-    if selected_label != "All categories":
-        scatter_df = scatter_df[scatter_df["category"] == label_to_key[selected_label]]
+    scatter_view = load_scatter(planets_df, classified_key)[selected_label]
+    scatter_df = scatter_view["points"]
+    chart_title = f"Mass vs semi-major axis — {selected_label}"
 
-    st.caption(
-        f"{len(scatter_df):,} planets with measured mass and orbit shown "
-        "(log–log scale). Hover a point for details; scroll to zoom, drag to pan."
-    )
-
-    scatter = (
-        alt.Chart(scatter_df)
-        .mark_circle(size=45, opacity=0.55)
-        .encode(
-            x=alt.X(
-                "pl_orbsmax:Q",
-                scale=alt.Scale(type="log"),
-                title="Semi-major axis (AU)",
-            ),
-            y=alt.Y(
-                "pl_bmasse:Q",
-                scale=alt.Scale(type="log"),
-                title="Mass (Earth masses)",
+    if len(scatter_df) <= SCATTER_POINT_LIMIT:
+        st.caption(
+            f"{len(scatter_df):,} planets with measured mass and orbit shown "
+            "(log–log scale). Hover a point for details; scroll to zoom, drag to pan."
+        )
+        st.altair_chart(
+            scatter_points_chart(
+                chart_data(scatter_df, f"{classified_key}:scatter_points:{selected_label}"), chart_title
             ),
-            color=alt.Color(
-                "Category:N",
-                scale=alt.Scale(
-                    domain=[CATEGORY_LABELS[c] for c in CATEGORY_ORDER],
-                    range=[CATEGORY_COLORS[CATEGORY_LABELS[c]] for c in CATEGORY_ORDER],
-                ),
-                legend=alt.Legend(orient="bottom"),
+            width="stretch",
+        )
+    else:
+        # Level of detail: the overview is a binned density map; individual
+        # points are only sent for the region brushed on it.
+        st.caption(
+            f"{len(scatter_df):,} planets with measured mass and orbit, binned on a "
+            "log–log grid (darker = more planets). Drag a box over a region to "
+            "see its individual planets."
+        )
+        density_event = st.altair_chart(
+            scatter_density_chart(
+                chart_data(scatter_view["density"], f"{classified_key}:scatter_density:{selected_label}"),
+                chart_title,
             ),
-            tooltip=[
-                alt.Tooltip("pl_name:N", title="Planet"),
-                alt.Tooltip("Category:N"),
-                alt.Tooltip("pl_orbsmax:Q", title="Semi-major axis (AU)", format=".3f"),
-                alt.Tooltip("pl_bmasse:Q", title="Mass (M⊕)", format=",.2f"),
-            ],
+            width="stretch",
+            on_select="rerun",
+            key=f"scatter_density_{selected_label}",
         )
-        .interactive()
-        .properties(height=520, title=f"Mass vs semi-major axis — {selected_label}")
-    )
-    st.altair_chart(scatter, width="stretch")
+        region = density_event.selection.get("region", {})
+        if "pl_orbsmax" in region and "pl_bmasse" in region:
+            (x_lo, x_hi), (y_lo, y_hi) = region["pl_orbsmax"], region["pl_bmasse"]
+            region_df = scatter_df[
+                scatter_df["pl_orbsmax"].between(x_lo, x_hi)
+                & scatter_df["pl_bmasse"].between(y_lo, y_hi)
+            ]
+            shown = (
+                region_df
+                if len(region_df) <= SCATTER_POINT_LIMIT
+                else region_df.sample(n=SCATTER_POINT_LIMIT, random_state=0)
+            )
+            st.caption(
+                f"{len(region_df):,} planets in the selected region"
+                + (f", {len(shown):,} of them shown" if len(shown) < len(region_df) else "")
+                + "."
+            )
+            st.altair_chart(
+                scatter_points_chart(shown, f"{chart_title} (selected region)"), width="stretch"
+            )
 
     dl_cols = st.columns((1, 1, 3))
     with dl_cols[0]:
-        st.download_button(
-            label="⬇️ Download data (CSV)",
-            data=scatter_df.drop(columns=["category"]).to_csv(index=False).encode("utf-8"),
-            file_name=f"{selected_label.replace(' ', '_').lower()}_mass_vs_orbit.csv",
-            mime="text/csv",
+        export_menu(
+            "⬇️ Download data",
+            lambda df=scatter_df: df.drop(columns=["category"]),
+            f"{classified_key}:scatter:{selected_label}",
+            f"{selected_label.replace(' ', '_').lower()}_mass_vs_orbit",
         )
     with dl_cols[1]:
-        # Static PNG for users who want an image file
-        fig, ax = plt.subplots(figsize=(10, 6))
-        for cat in scatter_df["Category"].unique():
-            sub = scatter_df[scatter_df["Category"] == cat]
-            ax.scatter(
-                sub["pl_orbsmax"], sub["pl_bmasse"],
-                s=12, alpha=0.55, label=cat,
-                color=CATEGORY_COLORS[cat],
-            )
-        ax.set_xscale("log")
-        ax.set_yscale("log")
-        ax.set_xlabel("Semi-major axis (AU)")
-        ax.set_ylabel("Mass (Earth masses)")
-        ax.set_title(f"Mass vs semi-major axis — {selected_label}")
-        ax.legend()
-        buf = BytesIO()
-        fig.savefig(buf, format="png", dpi=150, bbox_inches="tight")
-        plt.close(fig)
-        buf.seek(0)
+        # Static PNG for users who want an image file, rendered on click
         st.download_button(
             label="⬇️ Download chart (PNG)",
-            data=buf,
+            data=functools.partial(
+                scatter_png, scatter_df, f"{classified_key}:{selected_label}", selected_label
+            ),
             file_name=f"{selected_label.replace(' ', '_').lower()}_scatter.png",
             mime="image/png",
+            on_click="ignore",
         )
 
 
 # ---------------------------------------------------------------------------
 # Tab 4 — Detection methods
 # ---------------------------------------------------------------------------
-with tab4:
+@st.fragment
+def detection_tab() -> None:
+    """Detection methods."""
     st.subheader("How confirmed exoplanets were discovered")
 
-    method_counts = (
-        planets_df["discoverymethod"]
-        .value_counts()
-        .rename_axis("Method")
-        .reset_index(name="Planets")
-    )
-    method_counts["Percentage"] = (
-        method_counts["Planets"] / method_counts["Planets"].sum() * 100
-    )
-    # Only label slices large enough to have room; small ones use tooltip/table
-    method_counts["pct_label"] = np.where(
-        method_counts["Percentage"] >= 2.0,
-        method_counts["Percentage"].map(lambda p: f"{p:.1f}%"),
-        "",
-    )
+    method_counts = aggregates["method_counts"]
 
     col_chart, col_table = st.columns((3, 2), gap="large")
 
@@ -838,12 +2855,12 @@ with tab4:
             legend=alt.Legend(orient="right", title=None),
         )
         method_tooltip = [
-            "Method:N",
+            alt.Tooltip("Method:N"),
             alt.Tooltip("Planets:Q", format=","),
             alt.Tooltip("Percentage:Q", format=".2f", title="Percentage (%)"),
         ]
 
-        method_base = alt.Chart(method_counts).encode(
+        method_base = alt.Chart(chart_data(method_counts, f"{snapshot_key}:method_chart")).encode(
             theta=alt.Theta("Planets:Q", stack=True),
             order=alt.Order("Planets:Q", sort="descending"),
             color=method_color,
@@ -874,23 +2891,41 @@ with tab4:
         table_view["Planets"] = table_view["Planets"].map(lambda n: f"{n:,}")
         st.dataframe(table_view, hide_index=True, width="stretch", height=430)
 
-    st.download_button(
-        label="⬇️ Download this breakdown as CSV",
-        data=method_counts[["Method", "Planets", "Percentage"]]
-        .to_csv(index=False)
-        .encode("utf-8"),
-        file_name="exoplanets_by_detection_method.csv",
-        mime="text/csv",
+    export_menu(
+        "⬇️ Download this breakdown",
+        lambda df=method_counts: df[["Method", "Planets", "Percentage"]],
+        f"{snapshot_key}:methods",
+        "exoplanets_by_detection_method",
     )
 
 
 # ---------------------------------------------------------------------------
 # Tab 5 — Habitable exoplanets explorer (PHL Habitable Worlds Catalog)
 # ---------------------------------------------------------------------------
-with tab5:
-    hwc_df = load_hwc(ensure_hwc())
+@st.fragment
+def habitable_tab() -> None:
+    """Habitable exoplanets explorer."""
+    HAB_SOURCES = ("Habitable Worlds Catalog (PHL)", "Computed from the NASA archive")
+    hab_source = st.radio(
+        "Habitability data",
+        HAB_SOURCES,
+        index=0 if hwc is not None else 1,
+        horizontal=True,
+        key="hab_source",
+        help="The PHL catalog, or habitable-zone limits (Kopparapu et al. 2014) "
+        "and ESI computed here for every planet in the archive snapshot.",
+    )
+    from_archive = hab_source == HAB_SOURCES[1]
+    catalog, catalog_key = (
+        (habitability, f"{snapshot_key}:habitability") if from_archive else (hwc, hwc_key)
+    )
 
-    if hwc_df is None:
+    if catalog is None and "hwc" in start_refresher()["refreshing"]:
+        st.info(
+            "The Habitable Worlds Catalog is being downloaded from PHL in the "
+            "background — it will appear here on your next interaction."
+        )
+    elif catalog is None:
         st.markdown(
             CARD_CSS
             + '<div class="pl-title">Habitable exoplanets explorer</div>'
@@ -901,64 +2936,38 @@ with tab5:
         st.warning(
             "**Couldn't download the Habitable Worlds Catalog right now.** The app "
             "normally fetches it automatically from PHL and refreshes it weekly, so "
-            "this is likely a temporary network issue — try again shortly. As a "
+            "this is likely a temporary network issue — try again shortly. "
+            "Meanwhile, pick *Computed from the NASA archive* above. As a "
             "manual fallback, you can download the *Full Catalog — all exoplanets "
             "(CSV)* from the [PHL data page](https://phl.upr.edu/hwc/data), rename "
             "it `hwc.csv`, and commit it to the repository root."
         )
     else:
-        # --- Resolve columns across HWC naming variants -------------------
-        c_name = hwc_col(hwc_df, "p_name", "name", "pl_name")
-        c_hab = hwc_col(hwc_df, "p_habitable")
-        c_esi = hwc_col(hwc_df, "p_esi", "esi")
-        c_type = hwc_col(hwc_df, "p_type")
-        c_mass = hwc_col(hwc_df, "p_mass")
-        c_radius = hwc_col(hwc_df, "p_radius")
-        c_period = hwc_col(hwc_df, "p_period")
-        c_sma = hwc_col(hwc_df, "p_semi_major_axis", "p_sma")
-        c_tsurf = hwc_col(hwc_df, "p_temp_surf")
-        c_teq = hwc_col(hwc_df, "p_temp_equil")
-        c_sname = hwc_col(hwc_df, "s_name", "hostname")
-        c_stype = hwc_col(hwc_df, "s_type", "s_spec_type")
-        c_dist = hwc_col(hwc_df, "s_distance", "p_distance", "sy_dist")
-        c_detection = hwc_col(hwc_df, "p_detection", "p_detection_method")
-        c_year = hwc_col(hwc_df, "p_year", "p_discovery_year")
-
-        if c_name is None:
+        # Columns carry canonical HWC names whatever the source.
+        hab_df = catalog["habitable"]
+        if hab_df is None:
             st.error(
                 "The bundled `hwc.csv` doesn't look like the PHL Habitable Worlds "
                 "Catalog (no planet-name column found). Please re-download it from "
                 "[phl.upr.edu/hwc/data](https://phl.upr.edu/hwc/data)."
             )
-            st.stop()
-
-        # --- Potentially habitable subset, sorted by ESI ------------------
-        hab_df = hwc_df.copy()
-        if c_hab is not None:
-            hab_flags = pd.to_numeric(hab_df[c_hab], errors="coerce").fillna(0)
-            hab_df = hab_df[hab_flags > 0].copy()
-            hab_df["_sample"] = np.where(
-                pd.to_numeric(hab_df[c_hab], errors="coerce") == 1,
-                "Conservative",
-                "Optimistic",
-            )
-        else:
-            hab_df["_sample"] = "—"
-        if c_esi is not None:
-            hab_df["_esi"] = pd.to_numeric(hab_df[c_esi], errors="coerce")
-            hab_df = hab_df.sort_values("_esi", ascending=False)
-
-        n_cons = int((hab_df["_sample"] == "Conservative").sum())
-        n_opt = int((hab_df["_sample"] == "Optimistic").sum())
+            return
+        n_cons, n_opt = catalog["n_conservative"], catalog["n_optimistic"]
 
         # --- Overview cards ----------------------------------------------
         st.markdown(
             CARD_CSS
             + '<div class="pl-title">Habitable exoplanets explorer</div>'
-            '<div class="pl-meta">Potentially habitable worlds from the '
-            '<b><a href="https://phl.upr.edu/hwc" target="_blank" '
-            'style="color:#7fc4ff">Habitable Worlds Catalog</a></b> '
-            "(PHL @ UPR Arecibo), ranked by Earth Similarity Index</div>"
+            + (
+                '<div class="pl-meta">Potentially habitable worlds in the NASA Exoplanet '
+                "Archive snapshot, by habitable-zone position and Earth Similarity "
+                "Index computed from archive parameters</div>"
+                if from_archive
+                else '<div class="pl-meta">Potentially habitable worlds from the '
+                '<b><a href="https://phl.upr.edu/hwc" target="_blank" '
+                'style="color:#7fc4ff">Habitable Worlds Catalog</a></b> '
+                "(PHL @ UPR Arecibo), ranked by Earth Similarity Index</div>"
+            )
             + '<div class="cat-row">'
             + category_card("🌍", "Potentially habitable", f"{len(hab_df):,}", "#7bc86c")
             + category_card("🌿", "Conservative sample", f"{n_cons:,}", "#7bc86c")
@@ -969,29 +2978,40 @@ with tab5:
         st.divider()
 
         # --- Planet picker (sorted by ESI, best first) --------------------
-        hab_names = hab_df[c_name].dropna().astype(str).tolist()
+        hab_query = st.text_input(
+            "Find a habitable-zone planet by planet or star name",
+            placeholder="e.g. TRAPPIST-1 e, Proxima Cen",
+            help="Tolerates typos; results are ranked by match quality.",
+        )
+        hab_options = catalog["names"]
+        if hab_query.strip():
+            hab_matches = search_index(
+                load_hwc_search_index(hab_df, catalog_key), hab_query
+            )
+            if hab_matches:
+                hab_options = hab_matches
+            else:
+                st.caption(f"No habitable planets match “{hab_query}” — showing the full list.")
+
         selected_hab = st.selectbox(
             "Search for a potentially habitable exoplanet",
-            hab_names,
+            hab_options,
             index=0,
             help="Ordered by Earth Similarity Index — the most Earth-like first.",
         )
-        hrow = hab_df[hab_df[c_name].astype(str) == selected_hab].iloc[0]
+        hrow = hab_df.iloc[catalog["pos"][selected_hab]]
 
         sample = hrow["_sample"]
         sample_color = "#7bc86c" if sample == "Conservative" else "#5aa9e6"
         sample_icon = "🌿" if sample == "Conservative" else "🌊"
-        ptype = str(hrow[c_type]) if c_type is not None and pd.notna(hrow[c_type]) else ""
+        ptype = hwc_text(hrow, "p_type")
 
         meta_bits = []
-        if c_detection is not None and pd.notna(hrow[c_detection]):
-            meta_bits.append(f"Detected by <b>{hrow[c_detection]}</b>")
-        if c_year is not None and pd.notna(hrow[c_year]):
-            try:
-                meta_bits.append(f"Discovered in <b>{int(float(hrow[c_year]))}</b>")
-            except (TypeError, ValueError):
-                pass
-        if ptype:
+        if hwc_text(hrow, "p_detection") != "—":
+            meta_bits.append(f"Detected by <b>{hrow['p_detection']}</b>")
+        if pd.notna(hrow.get("p_year")):
+            meta_bits.append(f"Discovered in <b>{int(hrow['p_year'])}</b>")
+        if ptype != "—":
             meta_bits.append(f"PHL type: <b>{ptype}</b>")
 
         header_html = (
@@ -1004,39 +3024,26 @@ with tab5:
 
         # --- Distance in light-years -------------------------------------
         hab_dist_ly = "—"
-        if c_dist is not None:
-            dval = pd.to_numeric(pd.Series([hrow[c_dist]]), errors="coerce").iloc[0]
-            if pd.notna(dval):
-                hab_dist_ly = fmt(float(dval) * PC_TO_LY, 0)
+        if "s_distance" in hrow.index:
+            hab_dist_ly = fmt(hrow["s_distance"] * PC_TO_LY, 0)
 
         HAB_GREEN = "#7bc86c"
         hab_planet_cards = [
-            category_card("🌐", "Earth Similarity Index", hwc_num(hrow, c_esi), "#b8a2e3"),
-            category_card("📏", "Radius (Earth radii)", hwc_num(hrow, c_radius), HAB_GREEN),
-            category_card("🌍", "Mass (Earth masses)", hwc_num(hrow, c_mass), HAB_GREEN),
-            category_card("🔄", "Orbital period (days)", hwc_num(hrow, c_period, 1), HAB_GREEN),
+            category_card("🌐", "Earth Similarity Index", hwc_num(hrow, "p_esi"), "#b8a2e3"),
+            category_card("📏", "Radius (Earth radii)", hwc_num(hrow, "p_radius"), HAB_GREEN),
+            category_card("🌍", "Mass (Earth masses)", hwc_num(hrow, "p_mass"), HAB_GREEN),
+            category_card("🔄", "Orbital period (days)", hwc_num(hrow, "p_period", 1), HAB_GREEN),
         ]
         hab_star_cards = [
-            category_card("🌡️", "Surface temp. (K)*", hwc_num(hrow, c_tsurf, 0), HAB_GREEN)
-            if c_tsurf is not None
-            else category_card("🌡️", "Equilibrium temp. (K)", hwc_num(hrow, c_teq, 0), HAB_GREEN),
+            category_card("🌡️", "Surface temp. (K)*", hwc_num(hrow, "p_temp_surf", 0), HAB_GREEN)
+            if "p_temp_surf" in hab_df.columns
+            else category_card("🌡️", "Equilibrium temp. (K)", hwc_num(hrow, "p_temp_equil", 0), HAB_GREEN),
             category_card("✨", "Distance (light-years)", hab_dist_ly, "#b8a2e3"),
-            category_card("⭐", "Host star", str(hrow[c_sname]) if c_sname is not None and pd.notna(hrow[c_sname]) else "—", STAR_COLOR, small=True),
-            category_card("🌈", "Star type", str(hrow[c_stype]) if c_stype is not None and pd.notna(hrow[c_stype]) else "—", STAR_COLOR, small=True),
+            category_card("⭐", "Host star", hwc_text(hrow, "s_name"), STAR_COLOR, small=True),
+            category_card("🌈", "Star type", hwc_text(hrow, "s_type"), STAR_COLOR, small=True),
         ]
 
-        hab_artwork = fetch_nasa_artwork(selected_hab)
-        if hab_artwork:
-            himg, hpage = hab_artwork
-            hcol_cards, hcol_art = st.columns((3, 2), gap="large")
-            with hcol_art:
-                st.image(himg, width="stretch")
-                st.caption(
-                    "Artist's concept, representative of this planet type "
-                    f"(credit: NASA). [Interactive 3D model]({hpage})."
-                )
-        else:
-            hcol_cards = st.container()
+        hcol_cards = artwork_columns(selected_hab, "Interactive 3D model")
 
         with hcol_cards:
             st.markdown(
@@ -1045,7 +3052,37 @@ with tab5:
                 unsafe_allow_html=True,
             )
 
-        if c_tsurf is not None:
+            links = catalog if from_archive else crossmatch
+            arch_match = links["hab_arch_pos"][catalog["pos"][selected_hab]]
+            if "hz_inner" in hrow.index:
+                st.caption(
+                    f"Habitable zone: {fmt(hrow['hz_inner'])}–{fmt(hrow['hz_outer'])} AU "
+                    f"conservative, {fmt(hrow['hz_inner_opt'])}–{fmt(hrow['hz_outer_opt'])} AU "
+                    f"optimistic. Orbit: {fmt(hrow['p_semi_major_axis'], 3)} AU, receiving "
+                    f"{fmt(hrow['p_flux'])}× Earth's insolation."
+                )
+            if arch_match >= 0:
+                arow = planets_df.iloc[arch_match]
+                acat_label = CATEGORY_LABELS.get(arow["category"], arow["category"])
+                acat_color = CATEGORY_COLORS.get(acat_label, "#8a8a8a")
+                st.markdown(
+                    '<div class="cat-row">'
+                    + category_card(CATEGORY_ICONS.get(acat_label, "❔"), "Archive category", acat_label, acat_color, small=True)
+                    + category_card("📏", "Radius, archive (R⊕)", fmt(arow["pl_rade"]), acat_color)
+                    + category_card("🌍", "Mass, archive (M⊕)", fmt(arow["pl_bmasse"]), acat_color)
+                    + category_card("🔭", "Discovery facility", fmt(arow["disc_facility"]), "#b8a2e3", small=True)
+                    + "</div>",
+                    unsafe_allow_html=True,
+                )
+                if not from_archive:
+                    st.caption(
+                        f"Matched to **{arow['pl_name']}** in the NASA Exoplanet Archive "
+                        "snapshot — open it in the Planet Explorer for every archive parameter."
+                    )
+            else:
+                st.caption("Not found in the NASA Exoplanet Archive snapshot.")
+
+        if "p_temp_surf" in hab_df.columns:
             st.caption(
                 "*Modeled surface temperature assuming an Earth-like atmosphere "
                 "(PHL). Actual temperatures depend on the real atmosphere."
@@ -1053,9 +3090,9 @@ with tab5:
 
         with st.expander("What do 'conservative' and 'optimistic' mean?"):
             st.markdown(
-                "The HWC considers planets orbiting within their star's optimistic "
+                "Both sources consider planets orbiting within their star's optimistic "
                 "habitable zone. The **conservative sample** (≤ 1.6 Earth radii or "
-                "≤ 3 Earth masses) contains planets more likely to be rocky and to "
+                "≤ 3 Earth masses, inside the conservative zone) contains planets more likely to be rocky and to "
                 "support surface liquid water. The **optimistic sample** includes "
                 "larger planets — possible super-Earths, ocean worlds, or "
                 "mini-Neptunes — that are less likely to be rocky. Habitable-zone "
@@ -1063,15 +3100,40 @@ with tab5:
                 "planet is actually habitable."
             )
 
-        st.download_button(
-            label="⬇️ Download the potentially habitable list (CSV)",
-            data=hab_df.drop(columns=["_sample", "_esi"], errors="ignore")
-            .to_csv(index=False)
-            .encode("utf-8"),
-            file_name="potentially_habitable_exoplanets_hwc.csv",
-            mime="text/csv",
-        )
-        st.caption(
-            "Data: [Habitable Worlds Catalog](https://phl.upr.edu/hwc), "
-            "PHL @ UPR Arecibo (CC). Please cite PHL when reusing this data."
+        export_menu(
+            "⬇️ Download the potentially habitable list",
+            lambda df=hab_df, attrs=catalog["frame"].attrs: hwc_export(df, attrs),
+            f"{catalog_key}:habitable",
+            "potentially_habitable_exoplanets_archive" if from_archive else "potentially_habitable_exoplanets_hwc",
         )
+        if from_archive:
+            st.caption(
+                "Computed from the NASA Exoplanet Archive snapshot: habitable-zone limits "
+                "after Kopparapu et al. (2014), ESI after Schulze-Makuch et al. (2011) "
+                "using equilibrium temperature. Missing values are estimated from related "
+                "parameters, so these rankings are indicative only."
+            )
+        else:
+            coverage = crossmatch["coverage"]
+            st.caption(
+                f"{coverage['habitable_matched']:,} of {coverage['habitable']:,} potentially "
+                "habitable planets are linked to the NASA Exoplanet Archive snapshot "
+                f"({coverage['habitable_by_name']:,} by name, "
+                f"{coverage['habitable_by_host']:,} by host star and planet letter)."
+            )
+            st.caption(
+                "Data: [Habitable Worlds Catalog](https://phl.upr.edu/hwc), "
+                "PHL @ UPR Arecibo (CC). Please cite PHL when reusing this data."
+            )
+
+
+for tab, render_tab in (
+    (tab4, detection_tab),
+    (tab1, population_tab),
+    (tab2, explorer_tab),
+    (tab5, habitable_tab),
+    (tab3, mass_orbit_tab),
+):
+    if tab.open:
+        with tab:
+            render_tab()